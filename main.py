@@ -10,7 +10,7 @@ from utils.sql import Sql
 def main():
     parser = argparse.ArgumentParser(description="Sync data from source db to target db")
     parser.add_argument("--sync", choices=["full", "insert", "update", "delete"],
-                        help="Sync method: insert, update, delete, full = insert, update, then delete"
+                        help="Sync method: insert, update, delete, full = per table insert, update, then delete"
                         )
     parser.add_argument("--select", choices=["show_tables"],
                         help="Select method: show_tables"
@@ -103,6 +103,8 @@ def main():
         case "show_tables":
             sync.show_tables()
 
+    sql.close_pools()
+
 
 if __name__ == "__main__":
     main()
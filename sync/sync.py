@@ -2,10 +2,14 @@ import os
 
 import orjson
 
+from sync.sync_async import SyncAsync
 from sync.sync_delete import SyncDelete
 from sync.sync_insert import SyncInsert
 from sync.sync_select import SyncSelect
+from sync.sync_shard import SyncShard
+from sync.sync_stats import SyncStats
 from sync.sync_thread import SyncThread
+from sync.sync_throttle import SyncThrottle
 from sync.sync_update import SyncUpdate
 from utils import json
 
@@ -16,7 +20,20 @@ class Sync:
         self.log = log
         self.sql = sql
 
-        self.sync_thread = SyncThread(config, log)
+        # task scheduler, same pool interface
+        match self.config.engine:
+            case "thread" | "process":
+                self.sync_thread = SyncThread(config, log)
+            case "async":
+                self.sync_thread = SyncAsync(config, log)
+            case _:
+                msg = f"Unknown engine {self.config.engine}"
+                self.log.error(msg)
+                raise ValueError(msg)
+        self.sync_shard = SyncShard(config, log, sql)
+        self.sync_stats = SyncStats(config, log)
+        # shared by all actions and threads
+        self.sync_throttle = SyncThrottle.from_config(config, log)
 
         self.dry_run = "Dryrun: " if self.config.dry_run else ""
 
@@ -37,57 +54,113 @@ class Sync:
         return sync_tables
 
     def insert(self, tables):
-        sync_insert = SyncInsert(self.config, self.log, self.sql)
+        sync_insert = SyncInsert(self.config, self.log, self.sql, self.sync_throttle)
 
         self.log.info(f"{self.dry_run}insert new data: ",
                       f"Source: {self.config.db_source_name}:{self.config.db_source_dbname} -> "
                       f"Target: {self.config.db_target_name}:{self.config.db_target_dbname}"
                       )
 
-        results = self.sync_thread.pool(tables, sync_insert.sync_insert, sync_insert.sync_done_callback)
+        tasks = self.sync_shard.shard(tables, "insert")
+        tasks = self.sync_stats.order(tasks, "insert")
+        results = self.sync_thread.pool(tasks, sync_insert.sync_insert, sync_insert.sync_done_callback)
+        results = self.sync_shard.merge(results)
+        self.sync_stats.save_results(results, "insert")
 
         self.log.info(f"{self.dry_run}insert sync_thread.pool results ", results=results)
         return results
 
     def update(self, tables):
-        sync_update = SyncUpdate(self.config, self.log, self.sql)
+        sync_update = SyncUpdate(self.config, self.log, self.sql, self.sync_throttle)
 
         self.log.info(f"{self.dry_run}update new data: ",
                       f"Source: {self.config.db_source_name}:{self.config.db_source_dbname} -> "
                       f"Target: {self.config.db_target_name}:{self.config.db_target_dbname}"
                       )
 
-        results = self.sync_thread.pool(tables, sync_update.sync_update, sync_update.sync_done_callback)
+        tasks = self.sync_shard.shard(tables, "update")
+        tasks = self.sync_stats.order(tasks, "update")
+        results = self.sync_thread.pool(tasks, sync_update.sync_update, sync_update.sync_done_callback)
+        sync_update.sync_checkpoint.save_results(results)
+        results = self.sync_shard.merge(results)
+        self.sync_stats.save_results(results, "update")
 
         self.log.info(f"{self.dry_run}update sync_thread.pool results ", results=results)
         return results
 
     def delete(self, tables):
-        sync_delete = SyncDelete(self.config, self.log, self.sql)
+        sync_delete = SyncDelete(self.config, self.log, self.sql, self.sync_throttle)
 
         self.log.info(f"{self.dry_run}delete deleted data: ",
                       f"Source: {self.config.db_source_name}:{self.config.db_source_dbname} -> "
                       f"Target: {self.config.db_target_name}:{self.config.db_target_dbname}"
                       )
 
-        results = self.sync_thread.pool(tables, sync_delete.sync_delete, sync_delete.sync_done_callback)
+        tasks = self.sync_shard.shard(tables, "delete")
+        tasks = self.sync_stats.order(tasks, "delete")
+        results = self.sync_thread.pool(tasks, sync_delete.sync_delete, sync_delete.sync_done_callback)
+        results = self.sync_shard.merge(results)
+        self.sync_stats.save_results(results, "delete")
 
         self.log.info(f"{self.dry_run}delete sync_thread.pool results ", results=results)
         return results
 
     def full(self):
-        results = []
-
-        tables = self.get_tables("insert")
-        results.append(self.insert(tables))
-
-        tables = self.get_tables("update")
-        results.append(self.update(tables))
-
-        tables = self.get_tables("delete")
-        results.append(self.delete(tables))
+        # per table insert -> update -> delete chains in one pool, from the sync_tables_[action].json files
+        # a table's update starts after all its insert range tasks are done, its delete after its update
+        sync_insert = SyncInsert(self.config, self.log, self.sql, self.sync_throttle)
+        sync_update = SyncUpdate(self.config, self.log, self.sql, self.sync_throttle)
+        sync_delete = SyncDelete(self.config, self.log, self.sql, self.sync_throttle)
+        actions = [
+            ("insert", sync_insert.sync_insert, sync_insert.sync_done_callback),
+            ("update", sync_update.sync_update, sync_update.sync_done_callback),
+            ("delete", sync_delete.sync_delete, sync_delete.sync_done_callback),
+        ]
+
+        self.log.info(f"{self.dry_run}full sync: ",
+                      f"Source: {self.config.db_source_name}:{self.config.db_source_dbname} -> "
+                      f"Target: {self.config.db_target_name}:{self.config.db_target_dbname}"
+                      )
 
-        return results
+        chains = {}
+        for action, submit_function, callback_function in actions:
+            for table in self.get_tables(action):
+                if table["name"] not in chains:
+                    chains[table["name"]] = []
+                stage = {"action": action,
+                         "tasks": self.sync_shard.shard([table], action),
+                         "submit_function": submit_function,
+                         "callback_function": callback_function
+                         }
+                if action == "update":
+                    stage["prepare_function"] = self._exclude_inserted
+                chains[table["name"]].append(stage)
+        chains = self.sync_stats.order_chains(list(chains.values()))
+
+        results = self.sync_thread.pool_chains(chains)
+        sync_update.sync_checkpoint.save_results(results.get("update", []))
+
+        full_results = []
+        for action, submit_function, callback_function in actions:
+            action_results = self.sync_shard.merge(results.get(action, []))
+            self.sync_stats.save_results(action_results, action)
+            self.log.info(f"{self.dry_run}{action} sync_thread.pool_chains results ", results=action_results)
+            full_results.append(action_results)
+        return full_results
+
+    def _exclude_inserted(self, tasks, results):
+        # update after insert in a full sync chain: skip rows above the target max before the insert,
+        # they were just copied from the source; lowest of the insert range tasks
+        max_target_ids = [result["max_target_id"] for result in results
+                          if result.get("max_target_id") is not None]
+        if not max_target_ids:
+            return tasks
+        max_target_id = min(max_target_ids)
+        for task in tasks:
+            task["max_target_id"] = max_target_id
+            self.log.info(f"{self.dry_run}Table: {task['name']}: "
+                          f"update skips rows inserted by this run, above {max_target_id}")
+        return tasks
 
     def show_tables(self):
         sync_select = SyncSelect(self.config, self.log, self.sql)
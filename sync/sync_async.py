@@ -0,0 +1,135 @@
+import asyncio
+import concurrent.futures
+import itertools
+import time
+
+from sync.sync_thread import run_timed
+
+
+class SyncAsync:
+    # asyncio scheduler with the SyncThread pool interface, ENGINE=async
+    # chains are coroutines awaiting their stages in order; the db drivers are blocking db-api,
+    # so each task runs in one of MAX_THREADS worker threads
+    def __init__(self, config, log):
+        self.config = config
+        self.log = log
+
+        self.max_threads = self.config.max_threads
+        if self.max_threads <= 0:
+            raise ValueError(f"SyncAsync: Max threads {self.max_threads} must be 1 or greater")
+
+        # per pool call, shut down when its tasks are done
+        self.executor = None
+        # per pool call, at most MAX_THREADS tasks submitted to the executor at once
+        self.semaphore = None
+        # set by the first failed task, tasks still waiting are not started
+        self.failed = False
+
+        self.task_counter = itertools.count(1)
+
+    async def _run_task(self, action, submit_function, callback_function, table):
+        # tasks wait here until a worker thread is free, taken in submit order, keeps the SyncStats order
+        async with self.semaphore:
+            if self.failed:
+                raise asyncio.CancelledError()
+            task_id = next(self.task_counter)
+            table = table.copy()
+            table["task_id"] = task_id
+            if action:
+                self.log.info(f"Process {action} {table} task id {task_id}")
+            else:
+                self.log.info(f"Process {table} task id {task_id}")
+            future = asyncio.get_running_loop().run_in_executor(self.executor, run_timed, submit_function, table)
+            future.add_done_callback(callback_function)
+            try:
+                return await future
+            except Exception:
+                # before the semaphore is released to a waiting task
+                self.failed = True
+                raise
+
+    async def _gather(self, coroutines):
+        # first failure cancels the tasks still waiting; running tasks finish before the executor shuts down
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                tasks = [task_group.create_task(coroutine) for coroutine in coroutines]
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+        return [task.result() for task in tasks]
+
+    async def _pool(self, tables, submit_function, callback_function):
+        self.semaphore = asyncio.Semaphore(self.max_threads)
+        self.failed = False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads,
+                                                   thread_name_prefix="db-sync-pie") as self.executor:
+            return await self._gather([self._run_task(None, submit_function, callback_function, table)
+                                       for table in tables])
+
+    async def _run_chain(self, chain, results):
+        # stages in order, each after all tasks of the previous stage are done
+        stage_results = []
+        for stage in chain:
+            tasks = stage["tasks"]
+            if "prepare_function" in stage:
+                tasks = stage["prepare_function"](tasks, stage_results)
+            stage_results = await self._gather([self._run_task(stage["action"], stage["submit_function"],
+                                                               stage["callback_function"], table)
+                                                for table in tasks])
+            if stage["action"] not in results:
+                results[stage["action"]] = []
+            results[stage["action"]].extend(stage_results)
+
+    async def _pool_chains(self, chains):
+        results = {}
+        self.semaphore = asyncio.Semaphore(self.max_threads)
+        self.failed = False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads,
+                                                   thread_name_prefix="db-sync-pie") as self.executor:
+            await self._gather([self._run_chain(chain, results) for chain in chains])
+        return results
+
+    def pool(self, tables, submit_function, callback_function):
+        nbr_tables = len(tables)
+        if nbr_tables == 0:
+            raise ValueError("No tables provided")
+
+        start = time.perf_counter()
+        try:
+            self.log.info(f"Processing {nbr_tables} tables using asyncio in {self.max_threads} threads")
+            results = asyncio.run(self._pool(tables, submit_function, callback_function))
+        except Exception as e:
+            self.log.error(f"Task failed", e=e)
+            raise Exception(e)
+
+        finish = time.perf_counter()
+        elapsed = round(finish - start, 2)
+        self.log.info(f"It took {elapsed}s to finish.")
+        return list(results)
+
+    def pool_chains(self, chains):
+        # see SyncThread.pool_chains
+        nbr_tasks = sum([len(stage["tasks"]) for chain in chains for stage in chain])
+        if nbr_tasks == 0:
+            raise ValueError("No tables provided")
+
+        start = time.perf_counter()
+        try:
+            self.log.info(f"Processing {len(chains)} chains of {nbr_tasks} tasks using asyncio "
+                          f"in {self.max_threads} threads")
+            results = asyncio.run(self._pool_chains(chains))
+        except Exception as e:
+            self.log.error(f"Task chain failed", e=e)
+            raise Exception(e)
+
+        finish = time.perf_counter()
+        elapsed = round(finish - start, 2)
+        self.log.info(f"It took {elapsed}s to finish.")
+        return results
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+class SyncCheckpoint:
+    def __init__(self, config, log, sql):
+        self.config = config
+        self.log = log
+        self.sql = sql
+
+        self.checkpoint = self.config.db_update_checkpoint
+        self.overlap = self.config.db_update_checkpoint_overlap
+
+        # relative to the main dir, next to sync_tables_update.json
+        sync_dir = os.path.dirname(__file__)
+        main_dir = os.path.dirname(sync_dir)
+        self.checkpoint_file = os.path.join(main_dir, self.config.db_update_checkpoint_file)
+
+        self.lock = threading.Lock()
+
+        self.dry_run = "Dryrun: " if self.config.dry_run else ""
+
+    def _connect(self):
+        # local state file, always sqlite3, independent of DB_ENGINE
+        conn = sqlite3.connect(self.checkpoint_file)
+        # primary_id without a type, keeps int|str as selected from the source
+        conn.execute("CREATE TABLE IF NOT EXISTS checkpoints ("
+                     "name TEXT NOT NULL PRIMARY KEY, modified TEXT NOT NULL, primary_id, "
+                     "limit_reached INTEGER NOT NULL DEFAULT 0, updated TEXT NOT NULL)")
+        # files created before limit_reached
+        field_names = [row[1] for row in conn.execute("PRAGMA table_info(checkpoints)")]
+        if "limit_reached" not in field_names:
+            conn.execute("ALTER TABLE checkpoints ADD COLUMN limit_reached INTEGER NOT NULL DEFAULT 0")
+        return conn
+
+    def get_name(self, table_name):
+        # checkpoint per source -> target table
+        return (f"{self.config.db_source_name}:{self.config.db_source_dbname}:{table_name} -> "
+                f"{self.config.db_target_name}:{self.config.db_target_dbname}:{table_name}")
+
+    def get(self, table_name):
+        # highest (modified, primary id) applied by a previous run, None if none
+        if not self.checkpoint:
+            return None
+        with self.lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT modified, primary_id, limit_reached FROM checkpoints WHERE name = ?",
+                                   (self.get_name(table_name),)).fetchone()
+            finally:
+                conn.close()
+        if row is None:
+            return None
+        return {"modified": row[0], "primary_id": row[1], "limit_reached": bool(row[2])}
+
+    def get_modified_where(self, table_name, modified_field, primary_field, modified_from_datetime):
+        # sql condition and positional params for rows to update
+        # after a checkpoint: modified >= checkpoint - overlap, or strictly after (modified, primary id)
+        # if no overlap or the previous run stopped at the update limit, so runs stopped by the limit make progress
+        # even with more rows than the limit inside the overlap
+        # else the DB_UPDATE_MODIFIED_FROM_DATE lookback
+        param_style = self.sql.get_param_style("position")
+        checkpoint = self.get(table_name)
+        if checkpoint is None:
+            return f"{modified_field} >= {param_style}", [modified_from_datetime]
+
+        if self.overlap > 0 and not checkpoint["limit_reached"]:
+            modified = datetime.fromisoformat(checkpoint["modified"]) - timedelta(seconds=self.overlap)
+            return f"{modified_field} >= {param_style}", [modified.isoformat(" ")]
+
+        return (f"({modified_field} > {param_style} OR "
+                f"({modified_field} = {param_style} AND {primary_field} > {param_style}))",
+                [checkpoint["modified"], checkpoint["modified"], checkpoint["primary_id"]])
+
+    def save(self, table_name, modified, primary_id, limit_reached=False):
+        if not self.checkpoint or self.config.dry_run:
+            return
+        updated = datetime.now().isoformat(" ", timespec="seconds")
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.execute("INSERT INTO checkpoints (name, modified, primary_id, limit_reached, updated) "
+                             "VALUES (?, ?, ?, ?, ?) "
+                             "ON CONFLICT (name) DO UPDATE SET "
+                             "modified = excluded.modified, primary_id = excluded.primary_id, "
+                             "limit_reached = excluded.limit_reached, updated = excluded.updated",
+                             (self.get_name(table_name), str(modified), primary_id, int(limit_reached), updated))
+                conn.commit()
+            finally:
+                conn.close()
+        self.log.info(f"Table: {table_name}: checkpoint saved", modified=str(modified), primary_id=primary_id,
+                      limit_reached=limit_reached)
+
+    def save_results(self, results):
+        # each range task returns its last (modified, primary id) applied, rows are applied in that order
+        # all tasks done: continue after the highest; else after the lowest of the tasks stopped by the update limit,
+        # as later rows of those ranges were not applied
+        tables = {}
+        for result in results:
+            if "checkpoint" not in result:
+                continue
+            table_name = result["name"]
+            if table_name not in tables:
+                tables[table_name] = {"done": None, "stopped": None}
+            table = tables[table_name]
+            checkpoint = result["checkpoint"]
+            if checkpoint is None:
+                # no rows in range
+                continue
+            if result["limit_reached"]:
+                if table["stopped"] is None or checkpoint < table["stopped"]:
+                    table["stopped"] = checkpoint
+            elif table["done"] is None or checkpoint > table["done"]:
+                table["done"] = checkpoint
+
+        for table_name, table in tables.items():
+            if table["stopped"] is not None:
+                # the next run continues strictly after it, without the overlap
+                self.log.info(f"{self.dry_run}Table: {table_name}: update limit reached, "
+                              f"checkpoint at the last row applied")
+                modified, primary_id = table["stopped"]
+                self.save(table_name, modified, primary_id, limit_reached=True)
+            elif table["done"] is not None:
+                modified, primary_id = table["done"]
+                self.save(table_name, modified, primary_id)
+            # else no rows, keep the previous checkpoint
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,27 @@
-import time
-from math import ceil
-
+from sync.sync_shard import SyncShard
 from sync.sync_thread import SyncThread
+from sync.sync_throttle import SyncThrottle
 
 
 class SyncDelete:
-    def __init__(self, config, log, sql):
+    def __init__(self, config, log, sql, sync_throttle=None):
         self.config = config
         self.log = log
         self.sql = sql
 
         self.sync_thread = SyncThread(config, log)
+        self.sync_shard = SyncShard(config, log, sql)
+        # global throttle, shared with other actions when passed in
+        self.sync_throttle = sync_throttle if sync_throttle is not None else SyncThrottle.from_config(config, log)
 
         self.dry_run = "Dryrun: " if self.config.dry_run else ""
 
     def sync_delete(self, table):
         self.log.debug("_sync_delete")
-        time.sleep(2)
 
         table_name = table["name"]
         task_id = table["task_id"]
 
-        # for table in tables:
-        conn_source, cur_source = self.sql.connect_to_source()
-        conn_target, cur_target = self.sql.connect_to_target()
-
         self.log.info(f"Table: {table_name}")
 
         # get new data
@@ -37,82 +34,234 @@ class SyncDelete:
             self.log.error(msg)
             raise ValueError(msg)
 
-        db_delete_limit_select = self.config.db_delete_limit_select
-        db_delete_limit = self.config.db_delete_limit
+        db_delete_limit = self.sync_shard.get_limit(table, self.config.db_delete_limit)
 
-        row = self.sql.select_one_row(cur=cur_target,
-                                      sql=f"SELECT MAX({primary_field}) AS max_target_id FROM {table_name}",
-                                      params=(), assert_result=True,
-                                      error_msg=f"Unable to determine Target MAX({primary_field}) for {table_name}"
-                                      )
-        max_target_id = row["max_target_id"]
+        sync_throttle = self.sync_throttle.for_table(table)
+
+        if "delete_method" in table:
+            delete_method = table["delete_method"]
+        else:
+            delete_method = self.config.db_delete_method
+        if delete_method not in ("scan", "checksum"):
+            msg = f"Unknown delete method {delete_method} for {table_name}"
+            self.log.error(msg)
+            raise ValueError(msg)
+
+        # table config checked before acquiring, pooled connections are released on failure too
+        conn_source, cur_source = self.sql.acquire_source()
+        try:
+            conn_target, cur_target = self.sql.acquire_target()
+            try:
+                if delete_method == "checksum":
+                    total_nbr_rows_deleted = self._delete_checksum(table, table_name, primary_field, cur_source,
+                                                                   cur_target, db_delete_limit, sync_throttle)
+                else:
+                    total_nbr_rows_deleted = self._delete_scan(table, table_name, primary_field, cur_source,
+                                                               cur_target, db_delete_limit, sync_throttle)
+            finally:
+                self.sql.release_target(conn_target, cur_target)
+        finally:
+            self.sql.release_source(conn_source, cur_source)
 
         self.log.info(f"{self.dry_run}Table: {table_name}: "
-                      f"Target Max {primary_field}: {max_target_id}, "
-                      f"Max number of Source Rows to Delete from Target: {db_delete_limit_select}"
+                      f"done, deleted {total_nbr_rows_deleted} rows"
                       )
 
+        return {"name": table_name, "nbr_rows": total_nbr_rows_deleted, "task_id": task_id}
+
+    def _delete_scan(self, table, table_name, primary_field, cur_source, cur_target, db_delete_limit, sync_throttle):
+        # all ids of both sides, pages of DB_DELETE_LIMIT_SELECT target ids by keyset, primary > last id
+        # each page from the real next target id, so sparse or very large ids cost no empty selects; any key type
+        db_delete_limit_select = self.config.db_delete_limit_select
         param_style = self.sql.get_param_style("position")
-        total_nbr_rows_deleted = 0
-        nbr_batches = ceil(max_target_id / db_delete_limit_select)
-        for batch_nbr in range(nbr_batches):
 
-            start_id = batch_nbr * db_delete_limit_select + 1
-            end_id = start_id + db_delete_limit_select
+        # primary key range when the table is split into range tasks
+        range_where, range_params = self.sync_shard.get_range_where(table, primary_field)
+        sql_range_where = f" AND {range_where}" if range_where else ""
 
-            cur_source = self.sql.select(cur=cur_source,
-                                         sql=f"SELECT {primary_field} FROM {table_name} "
-                                             f"WHERE {primary_field} BETWEEN {param_style} AND {param_style}",
-                                         params=(start_id, end_id,)
-                                         )
-            source_ids = []
-            for index, row in enumerate(cur_source):
-                source_ids.append(row[primary_field])
+        self.log.info(f"{self.dry_run}Table: {table_name}: "
+                      f"Number of Target ids to compare per select: {db_delete_limit_select}"
+                      )
+
+        total_nbr_rows_deleted = 0
+        nbr_rows_to_delete = 0
+        last_id = None
+        while True:
+            if last_id is None:
+                sql_where = f"WHERE 1 = 1{sql_range_where}"
+                params = range_params
+            else:
+                sql_where = f"WHERE {primary_field} > {param_style}{sql_range_where}"
+                params = [last_id] + range_params
+            target_ids = [row[primary_field] for row in
+                          self.sql.select_all_rows(cur=cur_target,
+                                                   sql=f"SELECT {primary_field} FROM {table_name} {sql_where} "
+                                                       f"ORDER BY {primary_field} LIMIT {db_delete_limit_select}",
+                                                   params=params
+                                                   )]
+            if not target_ids:
+                break
 
-            cur_target = self.sql.select(cur=cur_target,
+            # source ids within the page bounds, both sides in primary key order
+            cur_source = self.sql.select(cur=cur_source,
                                          sql=f"SELECT {primary_field} FROM {table_name} "
-                                             f"WHERE {primary_field} BETWEEN {param_style} AND {param_style}",
-                                         params=(start_id, end_id,)
+                                             f"WHERE {primary_field} >= {param_style} AND {primary_field} <= {param_style} "
+                                             f"ORDER BY {primary_field}",
+                                         params=(target_ids[0], target_ids[-1],)
                                          )
-            target_ids = []
-            for index, row in enumerate(cur_target):
-                target_ids.append(row[primary_field])
+            sync_throttle.wait(statements=2)
 
-            target_ids_to_delete = [item for item in target_ids if item not in source_ids]
+            target_ids_to_delete = self._get_ids_to_delete(source_ids=(row[primary_field] for row in cur_source),
+                                                           target_ids=target_ids
+                                                           )
             nbr_target_to_delete = len(target_ids_to_delete)
 
-            msg = (f"{self.dry_run}Table: {table_name}: ",
+            msg = (f"{self.dry_run}Table: {table_name}: "
                    f"found {nbr_target_to_delete} rows to delete")
-            if nbr_target_to_delete >= db_delete_limit:
+            # limit by ids found, as dry runs delete none
+            limit_reached = nbr_rows_to_delete + nbr_target_to_delete >= db_delete_limit
+            if limit_reached:
                 msg += f", limiting to {db_delete_limit} rows"
-                target_ids_to_delete = target_ids_to_delete[:db_delete_limit]
+                target_ids_to_delete = target_ids_to_delete[:db_delete_limit - nbr_rows_to_delete]
             self.log.info(msg)
+            nbr_rows_to_delete += len(target_ids_to_delete)
 
-            sql_ids_params = ','.join([param_style] * len(target_ids_to_delete))
-
-            nbr_rows_deleted = self.sql.execute(cur=cur_target,
-                                                sql=f"DELETE FROM {table_name} "
-                                                    f"WHERE {primary_field} IN ({sql_ids_params})",
-                                                params=target_ids_to_delete
-                                                )
-            self.log.info(f"{self.dry_run}Table: {table_name}: "
-                          f"deleted {nbr_target_to_delete} rows"
-                          )
-
+            nbr_rows_deleted = self._delete_ids(cur_target, table_name, primary_field, target_ids_to_delete)
             total_nbr_rows_deleted += nbr_rows_deleted
-            if nbr_target_to_delete >= db_delete_limit:
+            sync_throttle.wait(rows=nbr_rows_deleted, statements=1)
+            if limit_reached:
                 self.log.info(f"{self.dry_run}reached delete limit of {db_delete_limit} rows in {table_name}")
                 break
-        # end for batch_nbr in range(nbr_batches):
+            if len(target_ids) < db_delete_limit_select:
+                # last page
+                break
+            last_id = target_ids[-1]
+
+        return total_nbr_rows_deleted
+
+    def _delete_checksum(self, table, table_name, primary_field, cur_source, cur_target, db_delete_limit, sync_throttle):
+        # compare COUNT, SUM and a sum of squares of ids per range on both sides, split ranges that differ in two
+        # ids selected only for differing ranges of up to DB_DELETE_LIMIT_SELECT target rows
+        # ranges exclusive start, inclusive end, as shard ranges
+        db_delete_limit_select = self.config.db_delete_limit_select
+        param_style = self.sql.get_param_style("position")
+
+        range_where, range_params = self.sync_shard.get_range_where(table, primary_field)
+        sql_range_where = f" WHERE {range_where}" if range_where else ""
+        row = self.sql.select_one_row(cur=cur_target,
+                                      sql=f"SELECT MIN({primary_field}) AS min_target_id, "
+                                          f"MAX({primary_field}) AS max_target_id FROM {table_name}{sql_range_where}",
+                                      params=range_params, assert_result=True,
+                                      error_msg=f"Unable to determine Target MIN/MAX({primary_field}) for {table_name}"
+                                      )
+        if row["min_target_id"] is None:
+            # null|None = no rows
+            return 0
+        if not isinstance(row["min_target_id"], int):
+            self.log.warning(f"Table: {table_name}: delete method checksum requires an integer {primary_field}, "
+                             f"using scan")
+            return self._delete_scan(table, table_name, primary_field, cur_source, cur_target, db_delete_limit,
+                                     sync_throttle)
+        # source rows above the target max are new, left for insert
+        max_target_id = row["max_target_id"]
+        min_target_id = row["min_target_id"] - 1
 
         self.log.info(f"{self.dry_run}Table: {table_name}: "
-                      f"done, deleted {total_nbr_rows_deleted} rows"
+                      f"Target {primary_field} range: {min_target_id + 1} - {max_target_id}, compare by checksum"
                       )
 
-        conn_source.close()
-        conn_target.close()
+        # count and sum alone match when ids missing on one side are offset by ids missing on the other, eg 5, 6 and 3, 8
+        # squares of the id modulo 46337 stay below 2^31, so the sum fits a 64 bit integer on every engine
+        sql_checksum = (f"SELECT COUNT({primary_field}) AS qty, SUM({primary_field}) AS sum_id, "
+                        f"SUM(({primary_field} % 46337) * ({primary_field} % 46337)) AS sum_square_id FROM {table_name} "
+                        f"WHERE {primary_field} > {param_style} AND {primary_field} <= {param_style}")
+        sql_ids = (f"SELECT {primary_field} FROM {table_name} "
+                   f"WHERE {primary_field} > {param_style} AND {primary_field} <= {param_style} "
+                   f"ORDER BY {primary_field}")
 
-        return {"name": table_name, "nbr_rows": total_nbr_rows_deleted, "task_id": task_id}
+        total_nbr_rows_deleted = 0
+        # limit by ids found, as dry runs delete none
+        nbr_rows_to_delete = 0
+        nbr_checksums = 0
+        nbr_leaves = 0
+        # depth first, lowest range next
+        ranges = [(min_target_id, max_target_id)]
+        while ranges and nbr_rows_to_delete < db_delete_limit:
+            start_id, end_id = ranges.pop()
+            source_row = self.sql.select_one_row(cur=cur_source, sql=sql_checksum, params=(start_id, end_id,))
+            target_row = self.sql.select_one_row(cur=cur_target, sql=sql_checksum, params=(start_id, end_id,))
+            sync_throttle.wait(statements=2)
+            nbr_checksums += 1
+            if (source_row["qty"] == target_row["qty"] and source_row["sum_id"] == target_row["sum_id"] and
+                    source_row["sum_square_id"] == target_row["sum_square_id"]):
+                continue
+            if target_row["qty"] == 0:
+                # source only rows, nothing to delete
+                continue
+
+            if target_row["qty"] > db_delete_limit_select and end_id - start_id > 1:
+                middle_id = start_id + (end_id - start_id) // 2
+                ranges.append((middle_id, end_id))
+                ranges.append((start_id, middle_id))
+                continue
+
+            nbr_leaves += 1
+            cur_source = self.sql.select(cur=cur_source, sql=sql_ids, params=(start_id, end_id,))
+            cur_target = self.sql.select(cur=cur_target, sql=sql_ids, params=(start_id, end_id,))
+            sync_throttle.wait(statements=2)
+            target_ids_to_delete = self._get_ids_to_delete(source_ids=(row[primary_field] for row in cur_source),
+                                                           target_ids=(row[primary_field] for row in cur_target)
+                                                           )
+            nbr_target_to_delete = len(target_ids_to_delete)
+            if not nbr_target_to_delete:
+                continue
+
+            msg = (f"{self.dry_run}Table: {table_name}: "
+                   f"found {nbr_target_to_delete} rows to delete in {primary_field} {start_id + 1} - {end_id}")
+            if nbr_rows_to_delete + nbr_target_to_delete >= db_delete_limit:
+                msg += f", limiting to {db_delete_limit} rows"
+                target_ids_to_delete = target_ids_to_delete[:db_delete_limit - nbr_rows_to_delete]
+            self.log.info(msg)
+            nbr_rows_to_delete += len(target_ids_to_delete)
+
+            nbr_rows_deleted = self._delete_ids(cur_target, table_name, primary_field, target_ids_to_delete)
+            total_nbr_rows_deleted += nbr_rows_deleted
+            sync_throttle.wait(rows=nbr_rows_deleted, statements=1)
+
+        if ranges:
+            self.log.info(f"{self.dry_run}reached delete limit of {db_delete_limit} rows in {table_name}")
+        self.log.info(f"{self.dry_run}Table: {table_name}: "
+                      f"compared {nbr_checksums} range checksums, selected ids of {nbr_leaves} ranges"
+                      )
+        return total_nbr_rows_deleted
+
+    def _delete_ids(self, cur_target, table_name, primary_field, ids):
+        # chunked, one short transaction per chunk, see Sql.delete_in
+        nbr_rows_deleted = self.sql.delete_in(cur=cur_target, table_name=table_name, field_name=primary_field, ids=ids)
+        self.log.info(f"{self.dry_run}Table: {table_name}: "
+                      f"deleted {len(ids)} rows"
+                      )
+        return nbr_rows_deleted
+
+    def _get_ids_to_delete(self, source_ids, target_ids):
+        # target ids not in source, both ascending
+        # integer keys: merge join as the ids are read, O(n + m)
+        # other keys: source set, as the database collation order may differ from python order
+        ids_to_delete = []
+        source_ids = iter(source_ids)
+        target_ids = iter(target_ids)
+        source_id = next(source_ids, None)
+        for target_id in target_ids:
+            if not isinstance(target_id, int):
+                source_set = set(source_ids)
+                source_set.add(source_id)
+                ids_to_delete.extend([item for item in [target_id, *target_ids] if item not in source_set])
+                return ids_to_delete
+            while source_id is not None and source_id < target_id:
+                source_id = next(source_ids, None)
+            if source_id != target_id:
+                ids_to_delete.append(target_id)
+        return ids_to_delete
 
     def sync_done_callback(self, future):
         # no need for yet
@@ -1,29 +1,30 @@
-import time
-
+from sync.sync_pipeline import SyncPipeline
+from sync.sync_shard import SyncShard
 from sync.sync_thread import SyncThread
+from sync.sync_throttle import SyncThrottle
+from utils.sql import SqlBatch
 
 
 class SyncInsert:
-    def __init__(self, config, log, sql):
+    def __init__(self, config, log, sql, sync_throttle=None):
         self.config = config
         self.log = log
         self.sql = sql
 
         self.sync_thread = SyncThread(config, log)
+        self.sync_pipeline = SyncPipeline(config, log)
+        self.sync_shard = SyncShard(config, log, sql)
+        # global throttle, shared with other actions when passed in
+        self.sync_throttle = sync_throttle if sync_throttle is not None else SyncThrottle.from_config(config, log)
 
         self.dry_run = "Dryrun: " if self.config.dry_run else ""
 
     def sync_insert(self, table):
         self.log.debug("sync_insert")
-        time.sleep(2)
 
         table_name = table["name"]
         task_id = table["task_id"]
 
-        # for table in tables:
-        conn_source, cur_source = self.sql.connect_to_source()
-        conn_target, cur_target = self.sql.connect_to_target()
-
         self.log.info(f"Table: {table_name}")
 
         # get new data
@@ -36,115 +37,214 @@ class SyncInsert:
             self.log.error(msg)
             raise ValueError(msg)
 
+        if "insert_method" in table:
+            insert_method = table["insert_method"]
+        else:
+            insert_method = self.config.db_insert_method
+
+        sync_throttle = self.sync_throttle.for_table(table)
+
         db_insert_batch_size = self.config.db_insert_batch_size
         db_insert_limit_select = self.config.db_insert_limit_select
+        # range tasks are bounded to db_insert_limit rows in total by SyncShard
         db_insert_limit = self.config.db_insert_limit
+        if db_insert_limit <= 0 or db_insert_limit_select <= 0:
+            msg = (f"Insert limit {db_insert_limit} and insert limit select {db_insert_limit_select} "
+                   f"must be 1 or greater for {table_name}")
+            self.log.error(msg)
+            raise ValueError(msg)
 
-        row = self.sql.select_one_row(cur=cur_source,
-                                      sql=f"SELECT MAX({primary_field}) AS max_source_id FROM {table_name}",
-                                      params=(), assert_result=True,
-                                      error_msg=f"Unable to determine Source MAX({primary_field}) for {table_name}"
-                                      )
-        max_source_id = row["max_source_id"]
-        if max_source_id is None:
-            # null|None = no rows
-            max_source_id = 0
-
-        row = self.sql.select_one_row(cur=cur_target,
-                                      sql=f"SELECT MAX({primary_field}) AS max_target_id FROM {table_name}",
-                                      params=(), assert_result=True,
-                                      error_msg=f"Unable to determine Target MAX({primary_field}) for {table_name}"
-                                      )
-        max_target_id = row["max_target_id"]
-        if max_target_id is None:
-            # null|None = no rows
-            max_target_id = 0
-
-        # dict -> %(field)s or [array] -> %s
-        # MySQLdb ? instead of %s = Exception: not all arguments converted during bytes formatting
-        sql_max_target_id = self.sql.get_param_placeholder("max_target_id")
-        params = self.sql.get_param_values({"max_target_id": max_target_id})
-
-        row = self.sql.select_one_row(cur=cur_source,
-                                      sql=f"SELECT COUNT({primary_field}) AS nbr_source_rows FROM {table_name} WHERE "
-                                          f"{primary_field} > {sql_max_target_id}",
-                                      params=params, assert_result=True,
-                                      error_msg=f"Unable to determine Source Number of Rows to Insert for {table_name}"
-                                      )
-        nbr_source_rows = row["nbr_source_rows"]
-
-        self.log.info(f"{self.dry_run}Table: {table_name}: "
-                      f"Source Max {primary_field}: {max_source_id}, "
-                      f"Target Max {primary_field}: {max_target_id}, "
-                      f"Number of Source Rows to Insert into Target: {nbr_source_rows}, "
-                      f"Max number of Source Rows to Insert into Target: {db_insert_limit_select}"
-                      )
+        # primary key range when the table is split into range tasks
+        range_where, range_params = self.sync_shard.get_range_where(table, primary_field)
+        sql_range_where = f" WHERE {range_where}" if range_where else ""
+        sql_range_and = f" AND {range_where}" if range_where else ""
 
-        param_style = self.sql.get_param_style("position")
-
-        cur_source = self.sql.select(cur=cur_source,
-                                     sql=f"SELECT * FROM {table_name} "
-                                         f"WHERE {primary_field} > {param_style} ORDER BY {primary_field} LIMIT {param_style} ",
-                                     params=(max_target_id, db_insert_limit_select,)
-                                     )
-
-        rows = []
-        sql_field_names = ""
-        sql_field_values = ""
-        row_nbr = 0
-        total_rows_affected = 0
-        for index, row in enumerate(cur_source):
-            msg = ""
-            row_nbr += 1
-
-            if index == 0:
-                for field, value in row.items():
-                    msg += f"{field}: {value}, "
-                    sql_field_names += f"{field}, "
-                    # other sql
-                    # sql_field_values += "?, "
-                    # MySQLdb %s if row list, or %(field)s to match row dict
-                    sql_field_values += self.sql.get_param_placeholder(field) + ", "
-
-                sql_field_names = sql_field_names.rstrip(", ")
-                sql_field_values = sql_field_values.rstrip(", ")
-
-            rows.append(row)
-
-            if row_nbr >= db_insert_limit:
-                self.log.info(f"{self.dry_run}reached insert limit of {db_insert_limit} rows into {table_name}")
-                break
-
-            if row_nbr % db_insert_batch_size == 0:
+        # table config checked before acquiring, pooled connections are released on failure too
+        conn_target, cur_target = self.sql.acquire_target()
+        try:
+            conn_source, cur_source = self.sql.acquire_source()
+            try:
+                row = self.sql.select_one_row(cur=cur_source,
+                                              sql=f"SELECT MAX({primary_field}) AS max_source_id FROM {table_name}{sql_range_where}",
+                                              params=range_params, assert_result=True,
+                                              error_msg=f"Unable to determine Source MAX({primary_field}) for {table_name}"
+                                              )
+                max_source_id = row["max_source_id"]
+                if max_source_id is None:
+                    # null|None = no rows
+                    max_source_id = 0
+
+                row = self.sql.select_one_row(cur=cur_target,
+                                              sql=f"SELECT MAX({primary_field}) AS max_target_id FROM {table_name}{sql_range_where}",
+                                              params=range_params, assert_result=True,
+                                              error_msg=f"Unable to determine Target MAX({primary_field}) for {table_name}"
+                                              )
+                max_target_id = row["max_target_id"]
+                if max_target_id is None:
+                    # null|None = no rows, or none yet in range
+                    max_target_id = table.get("range_start") or 0
+
+                param_style = self.sql.get_param_style("position")
+
+                row = self.sql.select_one_row(cur=cur_source,
+                                              sql=f"SELECT COUNT({primary_field}) AS nbr_source_rows FROM {table_name} WHERE "
+                                                  f"{primary_field} > {param_style}{sql_range_and}",
+                                              params=(max_target_id, *range_params,), assert_result=True,
+                                              error_msg=f"Unable to determine Source Number of Rows to Insert for {table_name}"
+                                              )
+                nbr_source_rows = row["nbr_source_rows"]
+
+                self.log.info(f"{self.dry_run}Table: {table_name}: "
+                              f"Source Max {primary_field}: {max_source_id}, "
+                              f"Target Max {primary_field}: {max_target_id}, "
+                              f"Number of Source Rows to Insert into Target: {nbr_source_rows}, "
+                              f"Max number of Source Rows to Insert into Target: {db_insert_limit}, "
+                              f"in pages of {db_insert_limit_select} rows"
+                              )
+            finally:
+                # counts done; reader stage selects from its own source connection
+                self.sql.release_source(conn_source, cur_source)
+
+            total_rows_affected = 0
+
+            def write_batch(rows):
+                nonlocal total_rows_affected
                 nbr_rows = len(rows)
                 self.log.info(f"{self.dry_run}inserting batch {nbr_rows} rows into {table_name}")
-                rows_affected = self.sql.execute_many(cur=cur_target,
-                                                      sql=f"INSERT INTO {table_name} ({sql_field_names}) VALUES ({sql_field_values})",
-                                                      params=rows
-                                                      )
+                rows_affected = self._insert_batch(cur_target, table_name, rows.field_names, rows, insert_method)
                 total_rows_affected += rows_affected
-                # reset batch
-                rows = []
-        # end for index, row in enumerate(self.cur_source):
-
-        # process remaining rows
-        nbr_rows = len(rows)
-        if nbr_rows > 0:
-            self.log.info(f"{self.dry_run}inserting remaining batch {nbr_rows} rows into {table_name}")
-            rows_affected = self.sql.execute_many(cur=cur_target,
-                                                  sql=f"INSERT INTO {table_name} ({sql_field_names}) VALUES ({sql_field_values})",
-                                                  params=rows
-                                                  )
-            total_rows_affected += rows_affected
-
-        conn_source.close()
-        conn_target.close()
+                sync_throttle.wait(rows=nbr_rows, statements=1, nbytes=sync_throttle.get_nbytes(rows))
+                return False
+
+            self.sync_pipeline.run(lambda: self._select_batches(table_name=table_name,
+                                                                primary_field=primary_field,
+                                                                last_id=max_target_id,
+                                                                sql_range_and=sql_range_and,
+                                                                range_params=range_params,
+                                                                db_insert_limit_select=db_insert_limit_select,
+                                                                db_insert_batch_size=db_insert_batch_size,
+                                                                db_insert_limit=db_insert_limit,
+                                                                sync_throttle=sync_throttle
+                                                                ),
+                                   write_batch
+                                   )
+        finally:
+            self.sql.release_target(conn_target, cur_target)
 
         self.log.info(f"{self.dry_run}Table: {table_name}: "
                       f"done, inserted {total_rows_affected} rows"
                       )
 
-        return {"name": table_name, "nbr_rows": total_rows_affected, "task_id": task_id}
+        # target max before this insert, see Sync.full
+        return {"name": table_name, "nbr_rows": total_rows_affected, "task_id": task_id, "max_target_id": max_target_id}
+
+    def _select_batches(self, table_name, primary_field, last_id, sql_range_and, range_params,
+            db_insert_limit_select, db_insert_batch_size, db_insert_limit, sync_throttle):
+        # keyset pagination; page through source by primary key until insert limit reached
+        # yields batches of db_insert_batch_size tuple rows
+        conn_source, cur_source = self.sql.acquire_source()
+        # rows as tuples, field order resolved once from the first select
+        cur_source_rows = self.sql.get_tuple_cursor(conn_source)
+        try:
+            param_style = self.sql.get_param_style("position")
+
+            rows = None
+            field_names = []
+            primary_index = 0
+            row_nbr = 0
+            limit_reached = False
+            while not limit_reached:
+                page_size = min(db_insert_limit_select, db_insert_limit - row_nbr)
+                if page_size <= 0:
+                    # LIMIT 0 selects no rows and would repeat from the same last id
+                    break
+                cur_source_rows = self.sql.select(cur=cur_source_rows,
+                                                  sql=f"SELECT * FROM {table_name} "
+                                                      f"WHERE {primary_field} > {param_style}{sql_range_and} "
+                                                      f"ORDER BY {primary_field} LIMIT {param_style} ",
+                                                  params=(last_id, *range_params, page_size,)
+                                                  )
+                sync_throttle.wait(statements=1)
+
+                if rows is None:
+                    field_names = self.sql.get_field_names(cur_source_rows)
+                    if primary_field not in field_names:
+                        msg = f"Primary field {primary_field} not found in {table_name}"
+                        self.log.error(msg)
+                        raise ValueError(msg)
+                    primary_index = field_names.index(primary_field)
+                    rows = SqlBatch(field_names)
+
+                page_nbr_rows = 0
+                for row in cur_source_rows:
+                    row_nbr += 1
+                    page_nbr_rows += 1
+                    last_id = row[primary_index]
+
+                    rows.append(row)
+
+                    if row_nbr >= db_insert_limit:
+                        self.log.info(f"{self.dry_run}reached insert limit of {db_insert_limit} rows into {table_name}")
+                        # page size is capped to the remaining limit, so this is the last row of the page
+                        limit_reached = True
+                        break
+
+                    if row_nbr % db_insert_batch_size == 0:
+                        yield rows
+                        # new batch, previous may still be queued for the writer
+                        rows = SqlBatch(field_names)
+                # end for row in cur_source_rows:
+
+                if page_nbr_rows < page_size:
+                    # last page, no more source rows
+                    break
+                self.log.info(f"{self.dry_run}Table: {table_name}: "
+                              f"paged {row_nbr} rows, next page after {primary_field} {last_id}")
+            # end while not limit_reached:
+
+            # remaining rows
+            if rows is not None and len(rows) > 0:
+                yield rows
+        finally:
+            # MySQLdb server side cursor, unread rows when stopped early
+            cur_source_rows.close()
+            self.sql.release_source(conn_source, cur_source)
+
+    def _insert_batch(self, cur_target, table_name, field_names, rows, insert_method):
+        match insert_method:
+            case "values":
+                return self.sql.insert_many(cur=cur_target,
+                                            table_name=table_name,
+                                            field_names=field_names,
+                                            rows=rows
+                                            )
+            case "copy":
+                # postgres only
+                return self.sql.copy_from_rows(cur=cur_target,
+                                               table_name=table_name,
+                                               field_names=field_names,
+                                               rows=rows
+                                               )
+            case "load_data":
+                # mysql|mariadb only
+                return self.sql.load_data_from_rows(cur=cur_target,
+                                                    table_name=table_name,
+                                                    field_names=field_names,
+                                                    rows=rows
+                                                    )
+            case "executemany":
+                # tuple rows, positional params
+                param_style = self.sql.get_param_style("position")
+                sql_field_names = ", ".join(field_names)
+                sql_field_values = ", ".join([param_style] * len(field_names))
+                return self.sql.execute_many(cur=cur_target,
+                                             sql=f"INSERT INTO {table_name} ({sql_field_names}) VALUES ({sql_field_values})",
+                                             params=list(rows)
+                                             )
+            case _:
+                msg = f"Unknown insert method {insert_method} for {table_name}"
+                self.log.error(msg)
+                raise ValueError(msg)
 
     def sync_done_callback(self, future):
         # no need for yet
@@ -0,0 +1,79 @@
+import queue
+import threading
+
+
+class SyncPipeline:
+    def __init__(self, config, log):
+        self.config = config
+        self.log = log
+
+        self.pipeline = self.config.db_pipeline
+        self.queue_size = self.config.db_pipeline_queue_size
+        if self.queue_size <= 0:
+            raise ValueError(f"SyncPipeline: Queue size {self.queue_size} must be 1 or greater")
+
+    def run(self, read_batches, write_batch):
+        # read_batches: generator function yielding batches, opens its own source connection
+        # write_batch: called per batch with the target connection, returns True to stop early
+        if not self.pipeline:
+            # read and write alternate in the calling thread
+            batches = read_batches()
+            try:
+                for batch in batches:
+                    if write_batch(batch):
+                        break
+            finally:
+                batches.close()
+            return
+
+        # reader stage on its own thread fills a bounded queue, writer stage drains it
+        # a full queue blocks the reader, limiting memory to queue_size batches
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def reader():
+            # generator closed in this thread, so its source connection is closed where it was opened
+            batches_read = read_batches()
+            try:
+                for batch in batches_read:
+                    if not put(("batch", batch)):
+                        return
+                put(("done", None))
+            except Exception as e:
+                self.log.error("SyncPipeline: reader exception", e=e)
+                put(("error", e))
+            finally:
+                batches_read.close()
+
+        reader_thread = threading.Thread(target=reader, name=f"{threading.current_thread().name}-reader", daemon=True)
+        reader_thread.start()
+        try:
+            while True:
+                item_type, item = batches.get()
+                if item_type == "done":
+                    break
+                if item_type == "error":
+                    raise Exception(item)
+                if write_batch(item):
+                    break
+        finally:
+            # release a reader blocked on a full queue
+            stop.set()
+            reader_thread.join()
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+from math import ceil
+
+
+class SyncShard:
+    def __init__(self, config, log, sql):
+        self.config = config
+        self.log = log
+        self.sql = sql
+
+        self.dry_run = "Dryrun: " if self.config.dry_run else ""
+
+    def shard(self, tables, action):
+        # split tables into primary key range tasks; range_start exclusive, range_end inclusive, None = open
+        tasks = []
+        for table in tables:
+            if "shards" in table:
+                nbr_shards = table["shards"]
+            else:
+                nbr_shards = self.config.db_shards
+
+            if nbr_shards <= 1:
+                tasks.append(table.copy())
+                continue
+
+            range_ends = self._get_range_ends(table, action, nbr_shards)
+            if len(range_ends) <= 1:
+                # too few rows or keys to split
+                task = table.copy()
+                task["shards"] = 1
+                tasks.append(task)
+                continue
+
+            if action != "insert":
+                # last range open, includes rows added after the bounds were selected
+                range_ends[-1] = None
+            nbr_shards = len(range_ends)
+            range_start = None
+            for shard_nbr, range_end in enumerate(range_ends):
+                task = table.copy()
+                task["shard"] = shard_nbr + 1
+                task["shards"] = nbr_shards
+                task["range_start"] = range_start
+                task["range_end"] = range_end
+                tasks.append(task)
+                range_start = range_end
+
+            self.log.info(f"{self.dry_run}Table: {table['name']}: {action} split into {nbr_shards} ranges",
+                          range_ends=range_ends)
+        return tasks
+
+    def merge(self, results):
+        # one result per table, rows and elapsed summed across range tasks
+        merged = {}
+        for result in results:
+            table_name = result["name"]
+            if table_name not in merged:
+                merged[table_name] = result.copy()
+                merged[table_name]["shards"] = 1
+                continue
+            merged[table_name]["nbr_rows"] += result["nbr_rows"]
+            if "elapsed" in result:
+                # total task time, not wall time
+                merged[table_name]["elapsed"] = round(merged[table_name].get("elapsed", 0) + result["elapsed"], 3)
+            merged[table_name]["shards"] += 1
+        return list(merged.values())
+
+    def get_limit(self, table, limit):
+        # per table limit shared across update|delete range tasks
+        # insert ranges are already bounded to DB_INSERT_LIMIT rows, see _get_range_ends
+        if "shards" in table and table["shards"] > 1:
+            return ceil(limit / table["shards"])
+        return limit
+
+    def get_range_where(self, table, primary_field):
+        # sql condition and positional params for the task range, "" if not a range task
+        param_style = self.sql.get_param_style("position")
+        conditions = []
+        params = []
+        if table.get("range_start") is not None:
+            conditions.append(f"{primary_field} > {param_style}")
+            params.append(table["range_start"])
+        if table.get("range_end") is not None:
+            conditions.append(f"{primary_field} <= {param_style}")
+            params.append(table["range_end"])
+        return " AND ".join(conditions), params
+
+    def _get_range_ends(self, table, action, nbr_shards):
+        table_name = table["name"]
+        if "primary_field" in table:
+            primary_field = table["primary_field"]
+        else:
+            primary_field = self.config.db_primary_field
+        if "shard_method" in table:
+            shard_method = table["shard_method"]
+        else:
+            shard_method = self.config.db_shard_method
+
+        param_style = self.sql.get_param_style("position")
+        sql_where = ""
+        params = ()
+
+        match action:
+            case "insert":
+                # new source rows above the current target max, up to DB_INSERT_LIMIT rows
+                # ranges are closed and each task copies its whole range, so no id gaps are left behind
+                # for the next run, which continues from MAX(target id)
+                conn_target, cur_target = self.sql.acquire_target()
+                try:
+                    row = self.sql.select_one_row(cur=cur_target,
+                                                  sql=f"SELECT MAX({primary_field}) AS max_id FROM {table_name}",
+                                                  params=(), assert_result=True,
+                                                  error_msg=f"Unable to determine Target MAX({primary_field}) for {table_name}"
+                                                  )
+                finally:
+                    self.sql.release_target(conn_target, cur_target)
+                min_id = row["max_id"]
+                if min_id is None:
+                    min_id = 0
+                conn, cur = self.sql.acquire_source()
+                release = self.sql.release_source
+            case "update":
+                min_id = None
+                conn, cur = self.sql.acquire_source()
+                release = self.sql.release_source
+            case "delete":
+                min_id = None
+                conn, cur = self.sql.acquire_target()
+                release = self.sql.release_target
+            case _:
+                raise ValueError(f"shard: Unknown action {action}")
+
+        try:
+            if min_id is not None:
+                row = self.sql.select_one_row(cur=cur,
+                                              sql=f"SELECT {primary_field} AS max_id FROM {table_name} "
+                                                  f"WHERE {primary_field} > {param_style} ORDER BY {primary_field} "
+                                                  f"LIMIT 1 OFFSET {param_style}",
+                                              params=(min_id, self.config.db_insert_limit - 1,)
+                                              )
+                if row is None:
+                    row = self.sql.select_one_row(cur=cur,
+                                                  sql=f"SELECT MAX({primary_field}) AS max_id FROM {table_name}",
+                                                  params=()
+                                                  )
+                sql_where = f"WHERE {primary_field} > {param_style} AND {primary_field} <= {param_style}"
+                params = (min_id, row["max_id"],)
+
+            match shard_method:
+                case "minmax":
+                    row = self.sql.select_one_row(cur=cur,
+                                                  sql=f"SELECT MIN({primary_field}) AS min_id, MAX({primary_field}) AS max_id "
+                                                      f"FROM {table_name} {sql_where}",
+                                                  params=params, assert_result=True,
+                                                  error_msg=f"Unable to determine MIN/MAX({primary_field}) for {table_name}"
+                                                  )
+                    if row["min_id"] is None:
+                        return []
+                    if not isinstance(row["min_id"], int):
+                        self.log.warning(f"Table: {table_name}: minmax shards require an integer {primary_field}, "
+                                         f"use shard_method quantile")
+                        return []
+                    min_id = row["min_id"] - 1
+                    max_id = row["max_id"]
+                    step = max(1, ceil((max_id - min_id) / nbr_shards))
+                    return list(range(min_id + step, max_id, step)) + [max_id]
+                case "quantile":
+                    # equal row count ranges; window functions, sqlite 3.25+, mysql 8+, mariadb 10.2+, postgres
+                    rows = self.sql.select_all_rows(cur=cur,
+                                                    sql=f"SELECT MAX({primary_field}) AS range_end FROM "
+                                                        f"(SELECT {primary_field}, NTILE({nbr_shards}) OVER "
+                                                        f"(ORDER BY {primary_field}) AS shard_nbr "
+                                                        f"FROM {table_name} {sql_where}) shards "
+                                                        f"GROUP BY shard_nbr ORDER BY range_end",
+                                                    params=params
+                                                    )
+                    return [row["range_end"] for row in rows]
+                case _:
+                    raise ValueError(f"shard: Unknown shard method {shard_method} for {table_name}")
+        finally:
+            release(conn, cur)
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+from datetime import datetime
+
+import orjson
+
+
+class SyncStats:
+    def __init__(self, config, log):
+        self.config = config
+        self.log = log
+
+        self.stats = self.config.db_stats
+
+        # relative to the main dir
+        sync_dir = os.path.dirname(__file__)
+        main_dir = os.path.dirname(sync_dir)
+        self.stats_file = os.path.join(main_dir, self.config.db_stats_file)
+
+        self.dry_run = "Dryrun: " if self.config.dry_run else ""
+
+    def get_name(self, action, table_name):
+        # stats per action and source -> target table
+        return (f"{action}:{self.config.db_source_name}:{self.config.db_source_dbname}:{table_name} -> "
+                f"{self.config.db_target_name}:{self.config.db_target_dbname}:{table_name}")
+
+    def load(self):
+        if not os.path.isfile(self.stats_file):
+            return {}
+        with open(self.stats_file, "rb") as file:
+            return orjson.loads(file.read())
+
+    def order(self, tasks, action):
+        # longest first (LPT), so the longest tables do not run alone at the end
+        # task estimate = previous table duration / nbr of range tasks
+        # tables without stats first, in file order, as they may be the longest
+        if not self.stats:
+            return tasks
+        stats = self.load()
+        # stable, keeps file order of equal estimates
+        return sorted(tasks, key=lambda task: self._get_estimate(stats, action, task), reverse=True)
+
+    def order_chains(self, chains):
+        # longest first by the sum of the chain stage estimates, see Sync.full
+        if not self.stats:
+            return chains
+        stats = self.load()
+        return sorted(chains, reverse=True,
+                      key=lambda chain: sum([self._get_estimate(stats, stage["action"], task)
+                                             for stage in chain for task in stage["tasks"]]))
+
+    def _get_estimate(self, stats, action, task):
+        name = self.get_name(action, task["name"])
+        if name not in stats:
+            return float("inf")
+        return stats[name]["elapsed"] / task.get("shards", 1)
+
+    def save_results(self, results, action):
+        # merged results, one per table; elapsed summed across range tasks
+        if not self.stats or self.config.dry_run:
+            return
+        stats = self.load()
+        updated = datetime.now().isoformat(" ", timespec="seconds")
+        for result in results:
+            if "elapsed" not in result:
+                continue
+            stats[self.get_name(action, result["name"])] = {
+                "elapsed": result["elapsed"],
+                "nbr_rows": result["nbr_rows"],
+                "updated": updated,
+            }
+        with open(self.stats_file, "wb") as file:
+            file.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
+        self.log.info(f"{action} stats saved", stats_file=self.stats_file)
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,36 @@ import concurrent.futures
 import itertools
 import time
 
+from utils.sql import Sql
+
+# ENGINE=process worker state, set once per worker process by _process_init
+_process_worker = {}
+
+
+def run_timed(submit_function, table):
+    # task duration, recorded by SyncStats; used by all schedulers
+    start = time.perf_counter()
+    result = submit_function(table)
+    result["elapsed"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _process_init(config, log):
+    # own Sql and connection pools per worker process; log sinks are enqueued, written by the parent process
+    _process_worker["config"] = config
+    _process_worker["log"] = log
+    _process_worker["sql"] = Sql(config, log)
+    _process_worker["actions"] = {}
+
+
+def _process_run(action_class, function_name, table):
+    # only the task and result dicts cross the process boundary; one SyncInsert|SyncUpdate|SyncDelete per worker
+    actions = _process_worker["actions"]
+    if action_class not in actions:
+        actions[action_class] = action_class(_process_worker["config"], _process_worker["log"],
+                                             _process_worker["sql"])
+    return run_timed(getattr(actions[action_class], function_name), table)
+
 
 class SyncThread:
     def __init__(self, config, log):
@@ -12,9 +42,10 @@ class SyncThread:
         if self.max_threads <= 0:
             raise ValueError(f"SyncThread: Max threads {self.max_threads} must be 1 or greater")
 
-        self.executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_threads, thread_name_prefix="db-sync-pie"
-        )
+        # ENGINE=process: worker processes instead of threads, for the cpu bound row hashing and id diffing
+        self.process = self.config.engine == "process"
+        # per pool call, shut down when its tasks are done
+        self.executor = None
 
         self.task_counter = itertools.count(1)
         self.tables = []
@@ -22,6 +53,13 @@ class SyncThread:
         self.callback_function = None
         self.futures = {}
 
+        # pool_chains
+        self.chains = []
+        self.chain_stage_nbrs = []
+        self.chain_nbr_pending = []
+        self.chain_results = []
+        self.ready = []
+
     def _pool_submit(self):
         if len(self.tables) == 0:
             return
@@ -29,10 +67,34 @@ class SyncThread:
         table = self.tables.pop(0)
         table["task_id"] = task_id
         self.log.info(f"Process {table} task id {task_id}")
-        future = self.executor.submit(self.submit_function, table)
+        future = self._submit(self.submit_function, table)
         future.add_done_callback(self.callback_function)
         self.futures[future] = task_id
 
+    def _get_executor(self):
+        if self.process:
+            # throttles, pools and caches are per worker process
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_threads, initializer=_process_init,
+                                                          initargs=(self.config, self.log))
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="db-sync-pie")
+
+    def _get_executor_name(self):
+        return "ProcessPoolExecutor" if self.process else "ThreadPoolExecutor"
+
+    def _submit(self, submit_function, table):
+        if self.process:
+            # bound methods of the parent action objects do not cross processes, the worker has its own
+            return self.executor.submit(_process_run, type(submit_function.__self__), submit_function.__name__, table)
+        return self.executor.submit(run_timed, submit_function, table)
+
+    def _shutdown(self):
+        # at most MAX_THREADS tasks are submitted at once; on the first failure the queued tasks are dropped,
+        # submitted tasks not yet started are cancelled, and running tasks finish before the pool call raises
+        self.tables = []
+        self.ready = []
+        self.futures = {}
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
     def pool(self, tables, submit_function, callback_function):
         self.tables = tables.copy()
         self.submit_function = submit_function
@@ -45,9 +107,10 @@ class SyncThread:
         results = []
         start = time.perf_counter()
         try:
-            self.log.info(f"Processing {nbr_tables} tables using ThreadPoolExecutor in {self.max_threads} threads")
+            self.log.info(f"Processing {nbr_tables} tables using {self._get_executor_name()} in {self.max_threads} workers")
 
-            with self.executor:
+            self.executor = self._get_executor()
+            try:
                 # Submit initial batch of tasks
                 for _ in range(self.max_threads):
                     self._pool_submit()
@@ -66,12 +129,11 @@ class SyncThread:
                         # self.log.info("thread pool future result", result=result)
                         results.append(result)
 
-                        if task_id < nbr_tables:
-                            # submit a new task if we haven't reached the total task limit
-                            self._pool_submit()
+                        # submit a new task if any left
+                        self._pool_submit()
                         # else: self.log.info("thread pool futures Finishing")
-
-                self.executor.shutdown(wait=True, cancel_futures=False)
+            finally:
+                self._shutdown()
         except Exception as e:
             self.log.error(f"Task {task_id} failed", e=e)
             raise Exception(e)
@@ -83,6 +145,94 @@ class SyncThread:
         self.log.info(f"It took {elapsed}s to finish.")
         return results
 
+    def _chain_next_stage(self, chain_nbr):
+        # queue the tasks of the next stage of the chain with any tasks
+        # optional stage prepare_function(tasks, results of the previous stage) returns the tasks to submit
+        chain = self.chains[chain_nbr]
+        while self.chain_stage_nbrs[chain_nbr] < len(chain):
+            stage = chain[self.chain_stage_nbrs[chain_nbr]]
+            self.chain_stage_nbrs[chain_nbr] += 1
+            if "prepare_function" in stage:
+                stage["tasks"] = stage["prepare_function"](stage["tasks"], self.chain_results[chain_nbr])
+            self.chain_results[chain_nbr] = []
+            if stage["tasks"]:
+                self.chain_nbr_pending[chain_nbr] = len(stage["tasks"])
+                for table in stage["tasks"]:
+                    self.ready.append((chain_nbr, stage, table))
+                return
+
+    def _chain_submit(self):
+        if len(self.ready) == 0:
+            return
+        task_id = next(self.task_counter)
+        chain_nbr, stage, table = self.ready.pop(0)
+        table["task_id"] = task_id
+        self.log.info(f"Process {stage['action']} {table} task id {task_id}")
+        future = self._submit(stage["submit_function"], table)
+        future.add_done_callback(stage["callback_function"])
+        self.futures[future] = (chain_nbr, stage["action"])
+
+    def pool_chains(self, chains):
+        # chains run concurrently in one pool, the stages of a chain in order
+        # eg per table insert -> update -> delete, so one table's delete overlaps another table's insert
+        # stage = {"action": ..., "tasks": [...], "submit_function": ..., "callback_function": ...}
+        # the tasks of a stage are submitted when all tasks of the previous stage of its chain are done
+        # returns {action: results}
+        self.chains = chains
+        self.chain_stage_nbrs = [0] * len(chains)
+        self.chain_nbr_pending = [0] * len(chains)
+        self.chain_results = [[] for _ in chains]
+        self.ready = []
+
+        nbr_tasks = sum([len(stage["tasks"]) for chain in chains for stage in chain])
+        if nbr_tasks == 0:
+            raise ValueError("No tables provided")
+
+        results = {}
+        start = time.perf_counter()
+        try:
+            self.log.info(f"Processing {len(chains)} chains of {nbr_tasks} tasks using {self._get_executor_name()} "
+                          f"in {self.max_threads} workers")
+
+            self.executor = self._get_executor()
+            try:
+                for chain_nbr in range(len(chains)):
+                    self._chain_next_stage(chain_nbr)
+                for _ in range(self.max_threads):
+                    self._chain_submit()
+
+                while self.futures:
+                    done, not_done = concurrent.futures.wait(
+                        self.futures, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+
+                    for future in done:
+                        chain_nbr, action = self.futures.pop(future)
+
+                        result = future.result()
+                        if action not in results:
+                            results[action] = []
+                        results[action].append(result)
+                        self.chain_results[chain_nbr].append(result)
+
+                        self.chain_nbr_pending[chain_nbr] -= 1
+                        if self.chain_nbr_pending[chain_nbr] == 0:
+                            self._chain_next_stage(chain_nbr)
+
+                    # fill idle threads, a finished stage may queue several tasks
+                    while len(self.futures) < self.max_threads and self.ready:
+                        self._chain_submit()
+            finally:
+                self._shutdown()
+        except Exception as e:
+            self.log.error(f"Task chain failed", e=e)
+            raise Exception(e)
+
+        finish = time.perf_counter()
+        elapsed = round(finish - start, 2)
+        self.log.info(f"It took {elapsed}s to finish.")
+        return results
+
 
 def main():
     print("not directly callable")
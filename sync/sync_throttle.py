@@ -0,0 +1,93 @@
+import threading
+import time
+
+
+class SyncThrottle:
+    def __init__(self, config, log, rows_per_sec=0, statements_per_sec=0, bytes_per_sec=0, parent=None):
+        self.config = config
+        self.log = log
+
+        # token bucket per limit; 0 = unlimited
+        # tokens may go negative, the caller then sleeps until the debt is repaid
+        self.rates = {"rows": rows_per_sec, "statements": statements_per_sec, "bytes": bytes_per_sec}
+        self.tokens = {name: rate for name, rate in self.rates.items()}
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+        # table throttle also waits on the global throttle
+        self.parent = parent
+        # table throttles by table name, one bucket shared by all range tasks of a table
+        self.tables = {}
+
+    @classmethod
+    def from_config(cls, config, log):
+        # global throttle shared by all threads
+        return cls(config, log,
+                   rows_per_sec=config.db_throttle_rows_per_sec,
+                   statements_per_sec=config.db_throttle_statements_per_sec,
+                   bytes_per_sec=config.db_throttle_bytes_per_sec,
+                   )
+
+    def for_table(self, table):
+        # table limits add a per table bucket, global limits still apply
+        rows_per_sec = table.get("throttle_rows_per_sec", 0)
+        statements_per_sec = table.get("throttle_statements_per_sec", 0)
+        bytes_per_sec = table.get("throttle_bytes_per_sec", 0)
+        if not (rows_per_sec or statements_per_sec or bytes_per_sec):
+            return self
+        table_name = table["name"]
+        with self.lock:
+            if table_name not in self.tables:
+                self.tables[table_name] = SyncThrottle(self.config, self.log,
+                                                       rows_per_sec=rows_per_sec,
+                                                       statements_per_sec=statements_per_sec,
+                                                       bytes_per_sec=bytes_per_sec,
+                                                       parent=self
+                                                       )
+            return self.tables[table_name]
+
+    def is_limited(self, name):
+        if self.rates[name] > 0:
+            return True
+        return self.parent is not None and self.parent.is_limited(name)
+
+    def get_nbytes(self, rows):
+        # approximate size of row values, only computed when a bytes limit is set
+        if not self.is_limited("bytes"):
+            return 0
+        nbytes = 0
+        for row in rows:
+            for value in row:
+                if value is not None:
+                    nbytes += len(value) if isinstance(value, (str, bytes)) else 8
+        return nbytes
+
+    def wait(self, rows=0, statements=0, nbytes=0):
+        amounts = {"rows": rows, "statements": statements, "bytes": nbytes}
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+
+            wait = 0.0
+            for name, rate in self.rates.items():
+                if rate <= 0:
+                    continue
+                # refill, burst up to 1 second of rate
+                self.tokens[name] = min(rate, self.tokens[name] + elapsed * rate) - amounts[name]
+                if self.tokens[name] < 0:
+                    wait = max(wait, -self.tokens[name] / rate)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        if self.parent is not None:
+            self.parent.wait(rows=rows, statements=statements, nbytes=nbytes)
+
+
+def main():
+    print("not directly callable")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,37 @@
-import time
-
 import dateparser
 
+from sync.sync_checkpoint import SyncCheckpoint
+from sync.sync_pipeline import SyncPipeline
+from sync.sync_shard import SyncShard
 from sync.sync_thread import SyncThread
+from sync.sync_throttle import SyncThrottle
+from utils.sql import SqlBatch
 
 
 class SyncUpdate:
-    def __init__(self, config, log, sql):
+    # source and target row digest field, compare method "hash"
+    ROW_HASH_FIELD = "sync_row_hash"
+
+    def __init__(self, config, log, sql, sync_throttle=None):
         self.config = config
         self.log = log
         self.sql = sql
 
         self.sync_thread = SyncThread(config, log)
+        self.sync_pipeline = SyncPipeline(config, log)
+        self.sync_shard = SyncShard(config, log, sql)
+        self.sync_checkpoint = SyncCheckpoint(config, log, sql)
+        # global throttle, shared with other actions when passed in
+        self.sync_throttle = sync_throttle if sync_throttle is not None else SyncThrottle.from_config(config, log)
 
         self.dry_run = "Dryrun: " if self.config.dry_run else ""
 
     def sync_update(self, table):
         self.log.debug("_sync_update")
-        time.sleep(2)
 
         table_name = table["name"]
         task_id = table["task_id"]
 
-        # for table in tables:
-        conn_source, cur_source = self.sql.connect_to_source()
-        conn_target, cur_target = self.sql.connect_to_target()
-
         self.log.info(f"Table: {table_name}")
 
         # get updated data
@@ -57,95 +63,374 @@ class SyncUpdate:
 
         db_update_limit_select = self.config.db_update_limit_select
         modified_from_datetime = dateparser.parse(modified_from_date).isoformat(" ")
-        db_update_limit = self.config.db_update_limit
+        db_update_limit = self.sync_shard.get_limit(table, self.config.db_update_limit)
         db_update_compare_method = self.config.db_update_compare_method
+        db_update_batch_size = self.config.db_update_batch_size
+        if "update_method" in table:
+            update_method = table["update_method"]
+        else:
+            update_method = self.config.db_update_method
+        if update_method not in ("update", "upsert"):
+            msg = f"Unknown update method {update_method} for {table_name}"
+            self.log.error(msg)
+            raise ValueError(msg)
 
-        # dict -> %(field)s or [array] -> %s
-        # MySQLdb ? instead of %s = Exception: not all arguments converted during bytes formatting
-        sql_modified_from_datetime = self.sql.get_param_placeholder("modified_from_datetime")
-        params = self.sql.get_param_values({"modified_from_datetime": modified_from_datetime})
-
-        row = self.sql.select_one_row(cur=cur_source,
-                                      sql=f"SELECT COUNT({modified_field}) AS nbr_source_rows FROM {table_name} WHERE "
-                                          f"{modified_field} >= {sql_modified_from_datetime}",
-                                      params=params, assert_result=True,
-                                      error_msg=f"Unable to determine Source Number of Rows to update for {table_name}"
-                                      )
-        nbr_source_rows = row["nbr_source_rows"]
+        sync_throttle = self.sync_throttle.for_table(table)
 
-        self.log.info(f"{self.dry_run}Table: {table_name}: "
-                      f"Source {modified_field} >= {modified_from_datetime}, "
-                      f"Number of Source Rows available to update into Target: {nbr_source_rows}, "
-                      f"Max number of Source Rows to update into Target: {db_update_limit_select}"
-                      )
+        # primary key range when the table is split into range tasks
+        range_where, range_params = self.sync_shard.get_range_where(table, primary_field)
+        sql_range_and = f" AND {range_where}" if range_where else ""
+        if table.get("max_target_id") is not None:
+            # full sync: rows above the target max before the insert were just inserted from the source
+            sql_range_and += f" AND {primary_field} <= {self.sql.get_param_style('position')}"
+            range_params = [*range_params, table["max_target_id"]]
 
-        param_style = self.sql.get_param_style("position")
+        # modified since DB_UPDATE_MODIFIED_FROM_DATE, or after the checkpoint of the previous run
+        modified_where, modified_params = self.sync_checkpoint.get_modified_where(table_name, modified_field,
+                                                                                  primary_field,
+                                                                                  modified_from_datetime)
 
-        cur_source = self.sql.select(cur=cur_source,
-                                     sql=f"SELECT * FROM {table_name} "
-                                         f"WHERE {modified_field} >= {param_style} ORDER BY {primary_field} LIMIT {param_style}",
-                                     params=(modified_from_datetime, db_update_limit_select,)
-                                     )
-
-        sql_field_names = []
-        total_rows_affected = 0
-        sql = ""
-        for index, row in enumerate(cur_source):
-
-            if index == 0:
-                # build update sql
-                for key, value in row.items():
-                    sql_field_names.append(key)
-
-                sql = f"UPDATE {table_name} SET "
-                for sql_field_name in sql_field_names:
-                    if sql_field_name == primary_field:
-                        continue
-                    # other sql
-                    # sql_field_values += "?, "
-                    # MySQLdb %s if row list, or %(field)s to match row dict
-                    sql += f"{sql_field_name} = "
-                    sql += self.sql.get_param_placeholder(sql_field_name) + ", "
-
-                sql = sql.rstrip(", ") + " "
-                sql = sql + f"WHERE {primary_field} = "
-                sql = sql + self.sql.get_param_placeholder(primary_field)
-
-
-            if db_update_compare_method == "timestamp":
-                # if timestamp/modified same between source and target, skip
-                target_row = self.sql.select_one_row(cur=cur_target,
-                                         sql=f"SELECT {modified_field} FROM {table_name} "
-                                             f"WHERE {primary_field} = {param_style}",
-                                         params=(row[primary_field],)
-                                         )
-                if target_row == row[modified_field]:
-                    continue
-
-            row = self.sql.get_param_values(row)
-
-            # depends on db_engine, but if update is sent and no changes are required, rows_affected = 0
-            rows_affected = self.sql.execute(cur=cur_target,
-                                             sql=sql,
-                                             params=row
+        # table config checked before acquiring, pooled connections are released on failure too
+        conn_target, cur_target = self.sql.acquire_target()
+        try:
+            conn_source, cur_source = self.sql.acquire_source()
+            try:
+                row = self.sql.select_one_row(cur=cur_source,
+                                              sql=f"SELECT COUNT({modified_field}) AS nbr_source_rows FROM {table_name} WHERE "
+                                                  f"{modified_where}{sql_range_and}",
+                                              params=(*modified_params, *range_params,), assert_result=True,
+                                              error_msg=f"Unable to determine Source Number of Rows to update for {table_name}"
+                                              )
+                nbr_source_rows = row["nbr_source_rows"]
+
+                self.log.info(f"{self.dry_run}Table: {table_name}: "
+                              f"Source {modified_where} {modified_params}, "
+                              f"Number of Source Rows available to update into Target: {nbr_source_rows}, "
+                              f"Max number of Source Rows to update into Target: {db_update_limit}, "
+                              f"in pages of {db_update_limit_select} rows"
+                              )
+
+                # index advisory; pages are selected ORDER BY modified, primary
+                try:
+                    if not self.sql.has_index(cur_source, table_name, modified_field):
+                        self.log.warning(f"Table: {table_name}: Source {modified_field} is not indexed, each page scans the table; "
+                                         f"consider an index on ({modified_field}, {primary_field})")
+                except Exception as e:
+                    self.log.warning(f"Table: {table_name}: unable to check Source indexes", e=e)
+
+                # changed fields only, needs per field digests
+                changed_fields = self.config.db_update_changed_fields and db_update_compare_method == "hash"
+
+                sql_select_fields = "*"
+                hash_groups = []
+                row_hash_sqls = []
+                hash_select_fields = []
+                if db_update_compare_method == "hash":
+                    # digest over all non primary fields, or one per field for changed fields only
+                    # modified left out, so trigger bumps without data changes are skipped
+                    # in sql if the engine has md5, else in python
+                    hash_field_names = [field_name for field_name in self.sql.get_table_field_names(cur_source, table_name)
+                                        if field_name not in (primary_field, modified_field)]
+                    if not hash_field_names:
+                        # only primary and modified fields, no values to compare, target rows are skipped
+                        hash_groups = []
+                    elif changed_fields:
+                        hash_groups = [[field_name] for field_name in hash_field_names]
+                    else:
+                        hash_groups = [hash_field_names]
+                    row_hash_sqls = [self.sql.get_row_hash_sql(hash_group) for hash_group in hash_groups]
+                    if row_hash_sqls and row_hash_sqls[0]:
+                        hash_select_fields = [f"{row_hash_sql} AS {self.ROW_HASH_FIELD}_{hash_nbr}"
+                                              for hash_nbr, row_hash_sql in enumerate(row_hash_sqls)]
+                        # appended as the last fields, so the table field indexes are unchanged
+                        sql_select_fields = "*, " + ", ".join(hash_select_fields)
+                nbr_hash_fields = len(hash_select_fields)
+            finally:
+                # counts done; reader stage selects from its own source connection
+                self.sql.release_source(conn_source, cur_source)
+
+            total_rows_affected = 0
+            # last (modified, primary id) applied or skipped, rows are in (modified, primary) order
+            checkpoint = None
+            limit_stopped = False
+            sql = ""
+            sql_upsert = ""
+            # changed fields update sql by field set, (sql, update_indexes)
+            sql_updates = {}
+            table_field_names = []
+            update_indexes = []
+            hash_group_indexes = []
+            primary_index = 0
+            modified_index = 0
+
+            def write_batch(rows):
+                nonlocal total_rows_affected, checkpoint, limit_stopped, sql, sql_upsert, table_field_names, \
+                    update_indexes, hash_group_indexes, primary_index, modified_index
+                if not sql:
+                    # build update|upsert sql once from the source field order
+                    field_names = rows.field_names
+                    if nbr_hash_fields:
+                        field_names = field_names[:-nbr_hash_fields]
+                    table_field_names = field_names
+                    sql, update_indexes = self._get_update_sql(table_name, field_names, primary_field)
+                    if update_method == "upsert":
+                        sql_upsert = self.sql.get_upsert_sql(field_names, primary_field)
+                    hash_group_indexes = [[field_names.index(field_name) for field_name in hash_group]
+                                          for hash_group in hash_groups]
+                    primary_index = field_names.index(primary_field)
+                    modified_index = field_names.index(modified_field)
+
+                target_values = {}
+                match db_update_compare_method:
+                    case "timestamp":
+                        # target modified by primary key for the whole batch, instead of a select per row
+                        target_rows = self._select_target_rows(cur_target=cur_target,
+                                                               table_name=table_name,
+                                                               primary_field=primary_field,
+                                                               field_names=[modified_field],
+                                                               ids=[row[primary_index] for row in rows],
+                                                               sync_throttle=sync_throttle
+                                                               )
+                        for primary_id, target_row in target_rows.items():
+                            target_values[primary_id] = target_row[modified_field]
+                    case "hash":
+                        if nbr_hash_fields:
+                            field_names = hash_select_fields
+                        else:
+                            field_names = [field_name for hash_group in hash_groups for field_name in hash_group]
+                        target_rows = self._select_target_rows(cur_target=cur_target,
+                                                               table_name=table_name,
+                                                               primary_field=primary_field,
+                                                               field_names=field_names,
+                                                               ids=[row[primary_index] for row in rows],
+                                                               sync_throttle=sync_throttle
+                                                               )
+                        for primary_id, target_row in target_rows.items():
+                            if nbr_hash_fields:
+                                target_values[primary_id] = [target_row[f"{self.ROW_HASH_FIELD}_{hash_nbr}"]
+                                                             for hash_nbr in range(nbr_hash_fields)]
+                            else:
+                                target_values[primary_id] = [self.sql.get_row_hash([target_row[field_name]
+                                                                                    for field_name in hash_group])
+                                                             for hash_group in hash_groups]
+
+                # one transaction per batch, uncommitted rows rolled back on failure
+                with self.sql.transaction(cur_target) as transaction:
+                    # upsert: changed rows written in multi-row stmts after the compare
+                    upsert_rows = SqlBatch(table_field_names)
+                    limit_reached = False
+                    for row in rows:
+                        checkpoint = (row[modified_index], row[primary_index])
+                        row_sql = sql
+                        row_update_indexes = update_indexes
+
+                        if db_update_compare_method in ("timestamp", "hash"):
+                            primary_id = row[primary_index]
+                            if primary_id not in target_values:
+                                if update_method == "update":
+                                    # not in target yet, left for insert
+                                    continue
+                                # upsert inserts rows missed by insert
+                            else:
+                                if db_update_compare_method == "timestamp":
+                                    source_value = row[modified_index]
+                                elif nbr_hash_fields:
+                                    source_value = row[-nbr_hash_fields:]
+                                else:
+                                    source_value = [self.sql.get_row_hash([row[index] for index in hash_indexes])
+                                                    for hash_indexes in hash_group_indexes]
+                                # if timestamp/modified or row hash same between source and target, skip
+                                if target_values[primary_id] == source_value:
+                                    continue
+
+                                if changed_fields and update_method == "update":
+                                    # set only the fields whose digests differ, and modified as in the source
+                                    update_field_names = tuple([hash_group[0] for hash_group, source_hash, target_hash
+                                                                in zip(hash_groups, source_value, target_values[primary_id])
+                                                                if source_hash != target_hash] +
+                                                               [modified_field])
+                                    if update_field_names not in sql_updates:
+                                        sql_updates[update_field_names] = self._get_update_sql(table_name,
+                                                                                               table_field_names,
+                                                                                               primary_field,
+                                                                                               update_field_names)
+                                    row_sql, row_update_indexes = sql_updates[update_field_names]
+
+                        if update_method == "upsert":
+                            upsert_rows.append(row[:len(table_field_names)])
+                            if total_rows_affected + len(upsert_rows) >= db_update_limit:
+                                limit_reached = True
+                                break
+                            continue
+
+                        params = [row[index] for index in row_update_indexes]
+
+                        # depends on db_engine, but if update is sent and no changes are required, rows_affected = 0
+                        rows_affected = self.sql.execute(cur=cur_target,
+                                                         sql=row_sql,
+                                                         params=params,
+                                                         commit=False
+                                                         )
+                        transaction.add(1)
+
+                        total_rows_affected += rows_affected
+                        sync_throttle.wait(rows=1, statements=1, nbytes=sync_throttle.get_nbytes((params,)))
+
+                        if total_rows_affected >= db_update_limit:
+                            limit_reached = True
+                            break
+                    # end for row in rows:
+
+                    if len(upsert_rows) > 0:
+                        nbr_rows = len(upsert_rows)
+                        self.sql.insert_many(cur=cur_target,
+                                             table_name=table_name,
+                                             field_names=table_field_names,
+                                             rows=upsert_rows,
+                                             commit=False,
+                                             sql_upsert=sql_upsert
                                              )
-
-            total_rows_affected += rows_affected
-
-            if total_rows_affected >= db_update_limit:
-                self.log.info(f"{self.dry_run}reached update limit of {db_update_limit} rows in {table_name}")
-                break
-
-        # end for index, row in enumerate(self.cur_source):
-
-        conn_source.close()
-        conn_target.close()
+                        transaction.add(nbr_rows)
+                        # rows sent, as upsert rows affected differ by engine
+                        total_rows_affected += nbr_rows
+                        sync_throttle.wait(rows=nbr_rows, statements=1, nbytes=sync_throttle.get_nbytes(upsert_rows))
+
+                if limit_reached:
+                    limit_stopped = True
+                    self.log.info(f"{self.dry_run}reached update limit of {db_update_limit} rows in {table_name}")
+                return limit_reached
+
+            self.sync_pipeline.run(lambda: self._select_batches(table_name=table_name,
+                                                                sql_select_fields=sql_select_fields,
+                                                                primary_field=primary_field,
+                                                                modified_field=modified_field,
+                                                                modified_where=modified_where,
+                                                                modified_params=modified_params,
+                                                                sql_range_and=sql_range_and,
+                                                                range_params=range_params,
+                                                                db_update_limit_select=db_update_limit_select,
+                                                                db_update_batch_size=db_update_batch_size,
+                                                                sync_throttle=sync_throttle
+                                                                ),
+                                   write_batch
+                                   )
+        finally:
+            self.sql.release_target(conn_target, cur_target)
 
         self.log.info(f"{self.dry_run}Table: {table_name}: "
                       f"done, updated {total_rows_affected} rows"
                       )
 
-        return {"name": table_name, "nbr_rows": total_rows_affected, "task_id": task_id}
+        result = {"name": table_name, "nbr_rows": total_rows_affected, "task_id": task_id}
+        if self.sync_checkpoint.checkpoint:
+            # saved per table by Sync.update once all range tasks are done
+            result["checkpoint"] = checkpoint
+            result["limit_reached"] = limit_stopped
+        return result
+
+    def _select_batches(self, table_name, sql_select_fields, primary_field, modified_field, modified_where,
+            modified_params, sql_range_and, range_params, db_update_limit_select, db_update_batch_size, sync_throttle):
+        # keyset pagination on (modified, primary); page through modified source rows, oldest change first,
+        # until no more rows, or the writer stops at the update limit
+        # yields batches of db_update_batch_size modified tuple rows
+        conn_source, cur_source = self.sql.acquire_source()
+        # rows as tuples, field order resolved once from the first select
+        cur_source_rows = self.sql.get_tuple_cursor(conn_source)
+        try:
+            param_style = self.sql.get_param_style("position")
+
+            rows = None
+            field_names = []
+            primary_index = 0
+            modified_index = 0
+            row_nbr = 0
+            # first page from the modified where, next pages strictly after the last (modified, primary)
+            sql_where = modified_where
+            params = modified_params
+            while True:
+                cur_source_rows = self.sql.select(cur=cur_source_rows,
+                                                  sql=f"SELECT {sql_select_fields} FROM {table_name} "
+                                                      f"WHERE {sql_where}{sql_range_and} "
+                                                      f"ORDER BY {modified_field}, {primary_field} LIMIT {param_style}",
+                                                  params=(*params, *range_params, db_update_limit_select,)
+                                                  )
+                sync_throttle.wait(statements=1)
+
+                if rows is None:
+                    field_names = self.sql.get_field_names(cur_source_rows)
+                    for field_name in (primary_field, modified_field):
+                        if field_name not in field_names:
+                            msg = f"Field {field_name} not found in {table_name}"
+                            self.log.error(msg)
+                            raise ValueError(msg)
+                    primary_index = field_names.index(primary_field)
+                    modified_index = field_names.index(modified_field)
+                    rows = SqlBatch(field_names)
+
+                page_nbr_rows = 0
+                last_row = None
+                for row in cur_source_rows:
+                    row_nbr += 1
+                    page_nbr_rows += 1
+                    last_row = row
+
+                    rows.append(row)
+                    if len(rows) >= db_update_batch_size:
+                        yield rows
+                        # new batch, previous may still be queued for the writer
+                        rows = SqlBatch(field_names)
+                # end for row in cur_source_rows:
+
+                if page_nbr_rows < db_update_limit_select:
+                    # last page, no more modified source rows
+                    break
+                # OR expanded row comparison, (modified, primary) > (?, ?), uses a (modified, primary) index on all engines
+                sql_where = (f"({modified_field} > {param_style} OR "
+                             f"({modified_field} = {param_style} AND {primary_field} > {param_style}))")
+                params = (last_row[modified_index], last_row[modified_index], last_row[primary_index],)
+                self.log.info(f"{self.dry_run}Table: {table_name}: "
+                              f"paged {row_nbr} rows, next page after {modified_field} {last_row[modified_index]}, "
+                              f"{primary_field} {last_row[primary_index]}")
+            # end while True:
+
+            # remaining rows
+            if rows is not None and len(rows) > 0:
+                yield rows
+        finally:
+            # MySQLdb server side cursor, unread rows when stopped early
+            cur_source_rows.close()
+            self.sql.release_source(conn_source, cur_source)
+
+    def _select_target_rows(self, cur_target, table_name, primary_field, field_names, ids, sync_throttle):
+        # target rows by primary key; one IN (...) select per chunk of ids, sized to the engine param limit
+        param_style = self.sql.get_param_style("position")
+        chunk_size = self.sql.get_max_params()
+        sql_field_names = ", ".join([primary_field, *field_names])
+
+        target_rows = {}
+        for chunk_start in range(0, len(ids), chunk_size):
+            chunk_ids = ids[chunk_start:chunk_start + chunk_size]
+            sql_ids_params = ", ".join([param_style] * len(chunk_ids))
+            rows = self.sql.select_all_rows(cur=cur_target,
+                                            sql=f"SELECT {sql_field_names} FROM {table_name} "
+                                                f"WHERE {primary_field} IN ({sql_ids_params})",
+                                            params=chunk_ids
+                                            )
+            sync_throttle.wait(statements=1)
+            for row in rows:
+                target_rows[row[primary_field]] = row
+        return target_rows
+
+    def _get_update_sql(self, table_name, field_names, primary_field, update_field_names=None):
+        # SET non primary fields, or only update_field_names, WHERE primary field, positional params
+        param_style = self.sql.get_param_style("position")
+        if update_field_names is None:
+            update_field_names = [field_name for field_name in field_names if field_name != primary_field]
+        update_indexes = [field_names.index(field_name) for field_name in update_field_names]
+        update_indexes.append(field_names.index(primary_field))
+        sql_update_fields = ", ".join([f"{field_name} = {param_style}" for field_name in update_field_names])
+        sql = f"UPDATE {table_name} SET {sql_update_fields} WHERE {primary_field} = {param_style}"
+        return sql, update_indexes
 
     def sync_done_callback(self, future):
         # no need for yet
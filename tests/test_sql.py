@@ -0,0 +1,310 @@
+from tests.setup_tests import SetupTests
+from utils.sql import SqlBatch
+
+
+#
+# pipenv run pytest -c tests/pytest.ini  -v
+# Sql helpers against a scratch sqlite3 table
+#
+
+def get_scratch_table(sql, cur, table_name):
+    sql.execute(cur=cur, sql=f"DROP TABLE IF EXISTS {table_name}")
+    sql.execute(cur=cur, sql=f"CREATE TABLE {table_name} ("
+                             f"id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(64) NULL, price DECIMAL(10, 4) NULL)")
+    return ["id", "name", "price"]
+
+
+def test_insert_many_chunks():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    # 3 fields, 7 params = 2 rows per stmt
+    config.db_max_params = 7
+
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_scratch_insert_many"
+    field_names = get_scratch_table(sql, cur_target, table_name)
+
+    rows = [{"id": i, "name": f"name {i}", "price": i / 10} for i in range(1, 6)]
+    # tuple rows in field order also accepted
+    rows.append((6, None, None))
+
+    rows_affected = sql.insert_many(cur=cur_target, table_name=table_name, field_names=field_names, rows=rows)
+    assert rows_affected == 6
+
+    row = sql.select_one_row(cur=cur_target,
+                             sql=f"SELECT COUNT(id) AS qty, MAX(id) AS max_id FROM {table_name} WHERE name IS NULL")
+    assert row["qty"] == 1
+    assert row["max_id"] == 6
+
+    sql.execute(cur=cur_target, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_target.close()
+
+
+def test_insert_many_batch():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_max_params = 7
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_scratch_insert_batch"
+    get_scratch_table(sql, cur_source, table_name)
+    get_scratch_table(sql, cur_target, table_name)
+    sql.insert_many(cur=cur_source, table_name=table_name, field_names=["id", "name", "price"],
+                    rows=[(i, f"name {i}", i / 10) for i in range(1, 6)])
+
+    # tuple rows from the source into a flat batch
+    cur_source_rows = sql.get_tuple_cursor(conn_source)
+    cur_source_rows = sql.select(cur=cur_source_rows, sql=f"SELECT * FROM {table_name} ORDER BY id")
+    field_names = sql.get_field_names(cur_source_rows)
+    assert field_names == ["id", "name", "price"]
+    rows = SqlBatch(field_names)
+    for row in cur_source_rows:
+        rows.append(row)
+    assert len(rows) == 5
+    assert list(rows)[1] == [2, "name 2", 0.2]
+
+    rows_affected = sql.insert_many(cur=cur_target, table_name=table_name, field_names=field_names, rows=rows)
+    assert rows_affected == 5
+
+    row = sql.select_one_row(cur=cur_target, sql=f"SELECT SUM(id) AS sum_id FROM {table_name}")
+    assert row["sum_id"] == 15
+
+    sql.execute(cur=cur_source, sql=f"DROP TABLE IF EXISTS {table_name}")
+    sql.execute(cur=cur_target, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_source.close()
+    conn_target.close()
+
+
+class CopyCursor:
+    # local postgres stand-in; captures COPY FROM STDIN
+    def __init__(self):
+        self.sql = ""
+        self.data = ""
+        self.connection = self
+        self.nbr_commits = 0
+
+    def commit(self):
+        self.nbr_commits += 1
+
+    def copy_expert(self, sql, file):
+        self.sql = sql
+        self.data = file.read()
+
+
+def test_copy_from_rows():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_engine = "postgres"
+
+    cur = CopyCursor()
+    rows = [
+        {"id": 1, "name": "tab\there", "price": None},
+        (2, "back\\slash\nnewline", b"\x01\xff"),
+        (3, True, 1.5),
+    ]
+    rows_affected = sql.copy_from_rows(cur=cur, table_name="test_table", field_names=["id", "name", "price"],
+                                       rows=rows)
+    assert rows_affected == 3
+    assert cur.sql == "COPY test_table (id, name, price) FROM STDIN"
+    assert cur.data == ("1\ttab\\there\t\\N\n"
+                        "2\tback\\\\slash\\nnewline\t\\\\x01ff\n"
+                        "3\tt\t1.5\n")
+    assert cur.nbr_commits == 1
+
+
+class LoadDataCursor:
+    # local mysql stand-in; captures LOAD DATA LOCAL INFILE
+    def __init__(self):
+        self.sql = ""
+        self.data = b""
+        self.rowcount = -1
+        self.connection = self
+        self.nbr_commits = 0
+
+    def commit(self):
+        self.nbr_commits += 1
+
+    def execute(self, sql, params):
+        self.sql = sql
+        with open(params[0], "rb") as fh:
+            self.data = fh.read()
+        self.rowcount = self.data.count(b"\n")
+
+
+def test_load_data_from_rows():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_engine = "mysql"
+    config.db_target_local_infile = True
+    sql.param_style = "%s"
+
+    cur = LoadDataCursor()
+    rows = [
+        {"id": 1, "name": "tab\there", "price": None},
+        (2, "back\\slash\nnul\0", b"\x01\t"),
+        (3, False, "ü"),
+    ]
+    rows_affected = sql.load_data_from_rows(cur=cur, table_name="test_table", field_names=["id", "name", "price"],
+                                            rows=rows)
+    assert rows_affected == 3
+    assert cur.sql.startswith("LOAD DATA LOCAL INFILE %s INTO TABLE test_table ")
+    assert cur.sql.endswith("(id, name, price)")
+    assert cur.data == ("1\ttab\\there\t\\N\n"
+                        "2\tback\\\\slash\\nnul\\0\t\x01\\t\n"
+                        "3\t0\tü\n").encode("utf8")
+    assert cur.nbr_commits == 1
+
+
+def test_pool_reuse():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_pool = True
+
+    conn_source, cur_source = sql.acquire_source()
+    sql.release_source(conn_source, cur_source)
+
+    # idle connection reused
+    conn_reused, cur_reused = sql.acquire_source()
+    assert conn_reused is conn_source
+    row = sql.select_one_row(cur=cur_reused, sql="SELECT 1 AS one")
+    assert row["one"] == 1
+
+    # idle connection closed underneath the pool fails health check, replaced
+    sql.release_source(conn_reused, cur_reused)
+    conn_reused.close()
+    conn_new, cur_new = sql.acquire_source()
+    assert conn_new is not conn_reused
+    sql.release_source(conn_new, cur_new)
+
+    sql.close_pools()
+
+
+def test_transaction():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_scratch_transaction"
+    get_scratch_table(sql, cur_target, table_name)
+    # second connection only sees committed rows
+    conn_check, cur_check = sql.connect_to_target()
+    param_style = sql.get_param_style("position")
+
+    def insert(transaction, row_id):
+        sql.execute(cur=cur_target, sql=f"INSERT INTO {table_name} (id) VALUES ({param_style})",
+                    params=(row_id,), commit=False)
+        transaction.add(1)
+
+    try:
+        with sql.transaction(cur_target, commit_interval=2) as transaction:
+            insert(transaction, 1)
+            assert transaction.nbr_commits == 0
+            insert(transaction, 2)
+            assert transaction.nbr_commits == 1
+            insert(transaction, 3)
+            raise ValueError("fail open batch")
+    except ValueError:
+        pass
+
+    # committed interval kept, open rows rolled back
+    row = sql.select_one_row(cur=cur_check, sql=f"SELECT COUNT(id) AS qty FROM {table_name}")
+    assert row["qty"] == 2
+
+    # committed once on exit
+    with sql.transaction(cur_target) as transaction:
+        insert(transaction, 3)
+        insert(transaction, 4)
+    assert transaction.nbr_commits == 1
+    row = sql.select_one_row(cur=cur_check, sql=f"SELECT COUNT(id) AS qty FROM {table_name}")
+    assert row["qty"] == 4
+
+    sql.execute(cur=cur_target, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_check.close()
+    conn_target.close()
+
+
+def test_row_hash():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+
+    # null and empty string differ, as do shifted values
+    assert sql.get_row_hash([None, "a"]) != sql.get_row_hash(["", "a"])
+    assert sql.get_row_hash(["a", "b"]) != sql.get_row_hash(["ab", None])
+    assert sql.get_row_hash([1, b"\x01"]) == sql.get_row_hash(["1", b"\x01"])
+
+    # sqlite has no md5, hashed in python
+    assert sql.get_row_hash_sql(["name", "address"]) is None
+
+    config.db_engine = "mysql"
+    assert sql.get_row_hash_sql(["name", "address"]) == ("MD5(CONCAT_WS(CHAR(31), COALESCE(CONCAT('v', name), 'n'), "
+                                                         "COALESCE(CONCAT('v', address), 'n')))")
+    config.db_engine = "postgres"
+    assert sql.get_row_hash_sql(["name", "address"]) == ("MD5(COALESCE('v' || name::text, 'n') || CHR(31) || "
+                                                         "COALESCE('v' || address::text, 'n'))")
+
+
+def test_upsert_sql():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+
+    assert sql.get_upsert_sql(["id", "name", "price"], "id") == (" ON CONFLICT (id) DO UPDATE SET "
+                                                                 "name = excluded.name, price = excluded.price")
+    config.db_engine = "mysql"
+    assert sql.get_upsert_sql(["id", "name", "price"], "id") == (" ON DUPLICATE KEY UPDATE "
+                                                                 "name = VALUES(name), price = VALUES(price)")
+
+
+def test_has_index():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_scratch_index"
+    get_scratch_table(sql, cur_target, table_name)
+    sql.execute(cur=cur_target, sql=f"CREATE INDEX {table_name}_name_price ON {table_name} (name, price)")
+
+    # leading field only
+    assert sql.has_index(cur_target, table_name, "name")
+    assert not sql.has_index(cur_target, table_name, "price")
+
+    sql.execute(cur=cur_target, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_target.close()
+
+
+def test_delete_in():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_batch_size = 3
+
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_scratch_delete_in"
+    field_names = get_scratch_table(sql, cur_target, table_name)
+    sql.insert_many(cur=cur_target, table_name=table_name, field_names=field_names,
+                    rows=[(i, f"name {i}", None) for i in range(1, 11)])
+
+    stmts = []
+    execute = sql.execute
+
+    def execute_logged(cur, sql, params=(), commit=True):
+        stmts.append(sql)
+        return execute(cur=cur, sql=sql, params=params, commit=commit)
+
+    sql.execute = execute_logged
+
+    # no stmt without ids
+    assert sql.delete_in(cur=cur_target, table_name=table_name, field_name="id", ids=[]) == 0
+    assert stmts == []
+
+    # 3 + 3 + 1 ids
+    rows_affected = sql.delete_in(cur=cur_target, table_name=table_name, field_name="id", ids=[1, 2, 4, 5, 7, 8, 10])
+    assert rows_affected == 7
+    assert len(stmts) == 3
+    assert stmts[-1] == f"DELETE FROM {table_name} WHERE id IN (?)"
+    sql.execute = execute
+
+    row = sql.select_one_row(cur=cur_target, sql=f"SELECT SUM(id) AS sum_id FROM {table_name}")
+    assert row["sum_id"] == 3 + 6 + 9
+
+    sql.execute(cur=cur_target, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_target.close()
@@ -1,4 +1,18 @@
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
 from sync.sync import Sync
+from sync.sync_async import SyncAsync
+from sync.sync_checkpoint import SyncCheckpoint
+from sync.sync_delete import SyncDelete
+from sync.sync_insert import SyncInsert
+from sync.sync_thread import SyncThread
+from sync.sync_throttle import SyncThrottle
 from tests.setup_tests import SetupTests
 
 
@@ -131,6 +145,132 @@ def test_insert_second():
     conn_target.close()
 
 
+def test_insert_paged():
+    setup_tests = SetupTests()
+    qty_test_rows = 100
+    config, log, sql = setup_tests.get_setup()
+    config.db_insert_limit_select = 10
+    config.db_insert_batch_size = 7
+    config.db_insert_limit = 25
+    sync = Sync(config, log, sql)
+
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+
+    # multiple pages of db_insert_limit_select in one run
+    results = sync.insert(tables)
+    for result in results:
+        assert result["nbr_rows"] == config.db_insert_limit
+
+    for table in tables:
+        table_name = table["name"]
+
+        row_target = sync.sql.select_one_row(cur=cur_target,
+                                             sql=f"SELECT COUNT(id) AS nbr_target_rows, MAX(id) AS max_target_id "
+                                                 f"FROM {table_name}",
+                                             params=(), assert_result=True,
+                                             error_msg=f"Unable to determine Target Number of Rows for {table_name}"
+                                             )
+        nbr_target_rows = min(10 * 2 + config.db_insert_limit, qty_test_rows)
+        assert row_target["nbr_target_rows"] == nbr_target_rows
+        assert row_target["max_target_id"] == nbr_target_rows
+
+    # no pages selected for a zero limit, instead of LIMIT 0 from the same last id
+    sync_insert = SyncInsert(config, log, sql)
+    batches = sync_insert._select_batches(table_name="test_table_1", primary_field="id", last_id=0, sql_range_and="",
+                                          range_params=[], db_insert_limit_select=10, db_insert_batch_size=7,
+                                          db_insert_limit=0, sync_throttle=sync_insert.sync_throttle)
+    assert list(batches) == []
+
+    # non positive limits rejected
+    for db_insert_limit, db_insert_limit_select in ((0, 10), (25, 0)):
+        config.db_insert_limit = db_insert_limit
+        config.db_insert_limit_select = db_insert_limit_select
+        with pytest.raises(Exception):
+            sync.insert(tables)
+
+    conn_target.close()
+
+
+def test_insert_pipeline():
+    setup_tests = SetupTests()
+    qty_test_rows = 100
+    config, log, sql = setup_tests.get_setup()
+    config.db_insert_limit_select = 10
+    config.db_insert_batch_size = 4
+    config.db_insert_limit = 15
+    config.db_pipeline = True
+    config.db_pipeline_queue_size = 1
+    sync = Sync(config, log, sql)
+
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+
+    # reader thread fills a queue of 1 batch, writer drains
+    results = sync.insert(tables)
+    for result in results:
+        assert result["nbr_rows"] == config.db_insert_limit
+
+    for table in tables:
+        table_name = table["name"]
+
+        row_target = sync.sql.select_one_row(cur=cur_target,
+                                             sql=f"SELECT COUNT(id) AS nbr_target_rows, MAX(id) AS max_target_id "
+                                                 f"FROM {table_name}",
+                                             params=(), assert_result=True,
+                                             error_msg=f"Unable to determine Target Number of Rows for {table_name}"
+                                             )
+        nbr_target_rows = min(10 * 2 + 25 + config.db_insert_limit, qty_test_rows)
+        assert row_target["nbr_target_rows"] == nbr_target_rows
+        assert row_target["max_target_id"] == nbr_target_rows
+
+    conn_target.close()
+
+
+def test_insert_sharded():
+    setup_tests = SetupTests()
+    qty_test_rows = 100
+    config, log, sql = setup_tests.get_setup()
+    config.db_insert_limit_select = 10
+    config.db_insert_limit = 30
+    sync = Sync(config, log, sql)
+
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified", "shards": 3},
+    ]
+
+    # 3 primary key range tasks, merged into one result per table
+    results = sync.insert(tables)
+    assert len(results) == 1
+    for result in results:
+        assert result["nbr_rows"] == config.db_insert_limit
+        assert result["shards"] == 3
+
+    for table in tables:
+        table_name = table["name"]
+
+        row_target = sync.sql.select_one_row(cur=cur_target,
+                                             sql=f"SELECT COUNT(id) AS nbr_target_rows, MAX(id) AS max_target_id "
+                                                 f"FROM {table_name}",
+                                             params=(), assert_result=True,
+                                             error_msg=f"Unable to determine Target Number of Rows for {table_name}"
+                                             )
+        # ranges are copied whole, no id gaps
+        nbr_target_rows = min(10 * 2 + 25 + 15 + config.db_insert_limit, qty_test_rows)
+        assert row_target["nbr_target_rows"] == nbr_target_rows
+        assert row_target["max_target_id"] == nbr_target_rows
+
+    conn_target.close()
+
+
 def test_update():
     setup_tests = SetupTests()
     qty_test_rows = 100
@@ -170,6 +310,13 @@ def test_update():
         rows_affected = sync.sql.execute(cur=cur_source, sql=sql, params=())
         assert rows_affected == nbr_update_row_ids
 
+        # rows are updated oldest change first; only the updated rows are in the modified from date window
+        sync.sql.execute(cur=cur_source,
+                         sql=f"UPDATE {table_name} SET modified = '2000-01-01 00:00:00' "
+                             f"WHERE {primary_field} > {update_row_ids}",
+                         params=()
+                         )
+
     results = sync.update(tables)
     # [{'name': 'test_table_1', 'nbr_rows': 10, 'task_id': 1}]
     for result in results:
@@ -193,6 +340,413 @@ def test_update():
     conn_target.close()
 
 
+def test_update_timestamp():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_batch_size = 10
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 100
+    config.db_update_compare_method = "timestamp"
+    sync = Sync(config, log, sql)
+
+    conn_source, cur_source = sync.sql.connect_to_source()
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+
+    # same modified on both sides, except a few older target rows
+    # in the future, so the update triggers do not replace an unchanged modified
+    modified = (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+    param_style = sql.get_param_style("position")
+    for table in tables:
+        table_name = table["name"]
+        sync.sql.execute(cur=cur_source, sql=f"UPDATE {table_name} SET modified = {param_style}", params=(modified,))
+        sync.sql.execute(cur=cur_target, sql=f"UPDATE {table_name} SET modified = {param_style}", params=(modified,))
+        rows_affected = sync.sql.execute(cur=cur_target,
+                                         sql=f"UPDATE {table_name} SET modified = '2000-01-01 00:00:00' "
+                                             f"WHERE id BETWEEN 31 AND 35",
+                                         params=()
+                                         )
+        assert rows_affected == 5
+
+    # only the older target rows are updated; rows not yet in target are skipped
+    results = sync.update(tables)
+    for result in results:
+        assert result["nbr_rows"] == 5
+
+    for table in tables:
+        table_name = table["name"]
+        row = sync.sql.select_one_row(cur=cur_target,
+                                      sql=f"SELECT COUNT(id) AS qty FROM {table_name} WHERE modified = {param_style}",
+                                      params=(modified,)
+                                      )
+        row_target = sync.sql.select_one_row(cur=cur_target,
+                                             sql=f"SELECT COUNT(id) AS qty FROM {table_name}",
+                                             params=()
+                                             )
+        assert row["qty"] == row_target["qty"]
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_hash():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_batch_size = 10
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 100
+    config.db_update_compare_method = "hash"
+    sync = Sync(config, log, sql)
+
+    conn_source, cur_source = sync.sql.connect_to_source()
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+
+    # rows changed in the source but not yet synced, plus a few target only changes
+    expected_rows = 0
+    for table in tables:
+        table_name = table["name"]
+        source_rows = sync.sql.select_all_rows(cur=cur_source, sql=f"SELECT id, name FROM {table_name} WHERE id <= 20")
+        target_rows = sync.sql.select_all_rows(cur=cur_target, sql=f"SELECT id, name FROM {table_name} WHERE id <= 20")
+        target_names = {row["id"]: row["name"] for row in target_rows}
+        expected_rows += len([row for row in source_rows if target_names.get(row["id"]) != row["name"]])
+
+        rows_affected = sync.sql.execute(cur=cur_target,
+                                         sql=f"UPDATE {table_name} SET address = 'target only' "
+                                             f"WHERE id BETWEEN 41 AND 43",
+                                         params=()
+                                         )
+        assert rows_affected == 3
+        expected_rows += rows_affected
+
+    results = sync.update(tables)
+    for result in results:
+        assert result["nbr_rows"] == expected_rows
+
+    for table in tables:
+        table_name = table["name"]
+        row = sync.sql.select_one_row(cur=cur_target,
+                                      sql=f"SELECT COUNT(id) AS qty FROM {table_name} WHERE address = 'target only'",
+                                      params=()
+                                      )
+        assert row["qty"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_hash_modified_only():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_batch_size = 10
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 100
+    config.db_update_compare_method = "hash"
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+    table_name = "test_table_1"
+    param_style = sql.get_param_style("position")
+
+    # source data same as target, only modified bumped, as by a trigger on a no-op write
+    target_rows = sql.select_all_rows(cur=cur_target, sql=f"SELECT id, name, address FROM {table_name} "
+                                                          f"WHERE id BETWEEN 1 AND 7")
+    assert len(target_rows) == 7
+    modified = (datetime.now(timezone.utc) + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+    for row in target_rows:
+        sql.execute(cur=cur_source,
+                    sql=f"UPDATE {table_name} SET name = {param_style}, address = {param_style}, "
+                        f"modified = {param_style} WHERE id = {param_style}",
+                    params=(row["name"], row["address"], modified, row["id"])
+                    )
+
+    sync = Sync(config, log, sql)
+    results = sync.update([{"name": table_name, "modified_field": "modified"}])
+    for result in results:
+        assert result["nbr_rows"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_upsert():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_batch_size = 10
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 100
+    config.db_update_compare_method = "hash"
+    config.db_update_method = "upsert"
+    sync = Sync(config, log, sql)
+
+    conn_source, cur_source = sync.sql.connect_to_source()
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+
+    # a row missing from the target, and changed target rows
+    expected_rows = 0
+    for table in tables:
+        table_name = table["name"]
+        rows_affected = sync.sql.execute(cur=cur_target, sql=f"DELETE FROM {table_name} WHERE id = 60", params=())
+        assert rows_affected == 1
+        rows_affected = sync.sql.execute(cur=cur_target,
+                                         sql=f"UPDATE {table_name} SET address = 'target only' "
+                                             f"WHERE id BETWEEN 61 AND 62",
+                                         params=()
+                                         )
+        assert rows_affected == 2
+        expected_rows += rows_affected
+
+        # includes rows not inserted yet
+        source_ids = [row["id"] for row in sync.sql.select_all_rows(cur=cur_source, sql=f"SELECT id FROM {table_name}")]
+        target_ids = [row["id"] for row in sync.sql.select_all_rows(cur=cur_target, sql=f"SELECT id FROM {table_name}")]
+        expected_rows += len(set(source_ids) - set(target_ids))
+
+    results = sync.update(tables)
+    for result in results:
+        assert result["nbr_rows"] == expected_rows
+
+    for table in tables:
+        table_name = table["name"]
+        row_source = sync.sql.select_one_row(cur=cur_source, sql=f"SELECT COUNT(id) AS qty FROM {table_name}")
+        row_target = sync.sql.select_one_row(cur=cur_target, sql=f"SELECT COUNT(id) AS qty FROM {table_name}")
+        assert row_target["qty"] == row_source["qty"]
+        row = sync.sql.select_one_row(cur=cur_target,
+                                      sql=f"SELECT COUNT(id) AS qty FROM {table_name} WHERE address = 'target only'",
+                                      params=()
+                                      )
+        assert row["qty"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_checkpoint():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 1000
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 1000
+    config.db_update_compare_method = "none"
+    config.db_update_checkpoint = True
+    config.db_update_checkpoint_overlap = 0
+
+    conn_source, cur_source = sql.connect_to_source()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+    table_name = tables[0]["name"]
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        config.db_update_checkpoint_file = os.path.join(checkpoint_dir, "sync_checkpoints.db")
+        sync = Sync(config, log, sql)
+
+        # first run from the modified from date, all rows
+        row_source = sync.sql.select_one_row(cur=cur_source, sql=f"SELECT COUNT(id) AS qty FROM {table_name}")
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == row_source["qty"]
+
+        # nothing modified since the checkpoint
+        sync = Sync(config, log, sql)
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == 0
+
+        # one row modified after the checkpoint
+        row = sync.sql.select_one_row(cur=cur_source, sql=f"SELECT MAX(modified) AS modified FROM {table_name}")
+        modified = (datetime.fromisoformat(row["modified"]) + timedelta(minutes=1)).isoformat(" ")
+        param_style = sql.get_param_style("position")
+        sync.sql.execute(cur=cur_source,
+                         sql=f"UPDATE {table_name} SET address = 'checkpoint', modified = {param_style} WHERE id = 5",
+                         params=(modified,)
+                         )
+        sync = Sync(config, log, sql)
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == 1
+
+        checkpoint = SyncCheckpoint(config, log, sql).get(table_name)
+        assert checkpoint == {"modified": modified, "primary_id": 5, "limit_reached": False}
+
+        # pages of 1 row, stopped by the update limit, continues after the last row applied
+        modified = (datetime.fromisoformat(modified) + timedelta(minutes=1)).isoformat(" ")
+        sync.sql.execute(cur=cur_source,
+                         sql=f"UPDATE {table_name} SET address = 'checkpoint', modified = {param_style} "
+                             f"WHERE id IN (6, 8, 9)",
+                         params=(modified,)
+                         )
+        config.db_update_limit_select = 1
+        config.db_update_limit = 2
+        sync = Sync(config, log, sql)
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == 2
+        checkpoint = SyncCheckpoint(config, log, sql).get(table_name)
+        assert checkpoint == {"modified": modified, "primary_id": 8, "limit_reached": True}
+
+        sync = Sync(config, log, sql)
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == 1
+
+    conn_source.close()
+
+
+def test_update_checkpoint_overlap():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 1000
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 1000
+    config.db_update_compare_method = "none"
+    config.db_update_checkpoint = True
+    config.db_update_checkpoint_overlap = 60
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+    table_name = tables[0]["name"]
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        config.db_update_checkpoint_file = os.path.join(checkpoint_dir, "sync_checkpoints.db")
+        Sync(config, log, sql).update(tables)
+
+        # more rows with one modified than the update limit, inside the overlap of the next run
+        row = sql.select_one_row(cur=cur_source, sql=f"SELECT MAX(modified) AS modified FROM {table_name}")
+        modified = (datetime.fromisoformat(row["modified"]) + timedelta(seconds=30)).isoformat(" ")
+        param_style = sql.get_param_style("position")
+        sql.execute(cur=cur_source,
+                    sql=f"UPDATE {table_name} SET address = 'overlap', modified = {param_style} "
+                        f"WHERE id BETWEEN 1 AND 20",
+                    params=(modified,)
+                    )
+        row_source = sql.select_one_row(cur=cur_source, sql=f"SELECT COUNT(id) AS qty FROM {table_name} "
+                                                            f"WHERE address = 'overlap'")
+
+        # runs stopped by the limit continue after the last row applied, instead of rescanning the overlap
+        config.db_update_limit = 5
+        for _ in range(10):
+            results = Sync(config, log, sql).update(tables)
+            if results[0]["nbr_rows"] < config.db_update_limit:
+                break
+        row_target = sql.select_one_row(cur=cur_target, sql=f"SELECT COUNT(id) AS qty FROM {table_name} "
+                                                            f"WHERE address = 'overlap'")
+        assert row_target["qty"] == row_source["qty"]
+        checkpoint = SyncCheckpoint(config, log, sql).get(table_name)
+        assert (checkpoint["modified"], checkpoint["primary_id"]) == (modified, 20)
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_changed_fields():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 1000
+    config.db_update_compare_method = "hash"
+    config.db_update_changed_fields = True
+    sync = Sync(config, log, sql)
+
+    conn_source, cur_source = sync.sql.connect_to_source()
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+    ]
+    table_name = tables[0]["name"]
+
+    # target trigger also bumps modified
+    sync.sql.execute(cur=cur_target, sql=f"UPDATE {table_name} SET address = 'target only' WHERE id IN (71, 72)")
+    sync.sql.execute(cur=cur_target, sql=f"UPDATE {table_name} SET name = 'target only' WHERE id = 73")
+
+    # record update stmts
+    updates = {}
+    execute = sync.sql.execute
+
+    def execute_update(cur, sql, params=(), commit=True):
+        if sql.startswith("UPDATE"):
+            updates[params[-1]] = sql
+        return execute(cur=cur, sql=sql, params=params, commit=commit)
+
+    sync.sql.execute = execute_update
+    sync.update(tables)
+    sync.sql.execute = execute
+
+    param_style = sql.get_param_style("position")
+    assert updates[71] == (f"UPDATE {table_name} SET address = {param_style}, modified = {param_style} "
+                           f"WHERE id = {param_style}")
+    # same field set, same stmt
+    assert updates[72] is updates[71]
+    assert updates[73] == (f"UPDATE {table_name} SET name = {param_style}, modified = {param_style} "
+                           f"WHERE id = {param_style}")
+
+    row = sync.sql.select_one_row(cur=cur_target,
+                                  sql=f"SELECT COUNT(id) AS qty FROM {table_name} "
+                                      f"WHERE address = 'target only' OR name = 'target only'")
+    assert row["qty"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_update_hash_no_fields():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_update_limit_select = 100
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.db_update_limit = 1000
+    config.db_update_compare_method = "hash"
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+    param_style = sql.get_param_style("position")
+
+    # primary and modified fields only, nothing to hash
+    table_name = "test_scratch_update_keys"
+    modified = datetime.now(timezone.utc).replace(tzinfo=None)
+    for cur, row_modified in ((cur_source, modified), (cur_target, modified - timedelta(hours=2))):
+        sql.execute(cur=cur, sql=f"DROP TABLE IF EXISTS {table_name}")
+        sql.execute(cur=cur, sql=f"CREATE TABLE {table_name} (id INTEGER NOT NULL PRIMARY KEY, modified DATETIME)")
+        for row_id in range(1, 4):
+            sql.execute(cur=cur, sql=f"INSERT INTO {table_name} (id, modified) VALUES ({param_style}, {param_style})",
+                        params=(row_id, row_modified.isoformat(" ", timespec="seconds")))
+
+    tables = [
+        {"name": table_name, "modified_field": "modified"},
+    ]
+    for changed_fields in (False, True):
+        config.db_update_changed_fields = changed_fields
+        sync = Sync(config, log, sql)
+        results = sync.update(tables)
+        for result in results:
+            assert result["nbr_rows"] == 0
+
+    for cur in (cur_source, cur_target):
+        sql.execute(cur=cur, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_source.close()
+    conn_target.close()
+
+
 def test_delete():
     setup_tests = SetupTests()
     qty_test_rows = 100
@@ -258,5 +812,453 @@ def test_delete():
     conn_target.close()
 
 
+def test_delete_sharded():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_delete_limit = 10
+    sync = Sync(config, log, sql)
+
+    conn_source, cur_source = sync.sql.connect_to_source()
+    conn_target, cur_target = sync.sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified", "shards": 2, "shard_method": "quantile"},
+    ]
+
+    # delete rows in both ranges
+    source_ids_to_delete = [20, 50, 85]
+    param_style = sql.get_param_style("position")
+    sql_ids_params = ','.join([param_style] * len(source_ids_to_delete))
+    for table in tables:
+        table_name = table["name"]
+        nbr_rows_deleted = sync.sql.execute(cur=cur_source,
+                                            sql=f"DELETE FROM {table_name} WHERE id IN ({sql_ids_params})",
+                                            params=source_ids_to_delete
+                                            )
+        assert nbr_rows_deleted == len(source_ids_to_delete)
+
+    results = sync.delete(tables)
+    assert len(results) == 1
+    for result in results:
+        assert result["nbr_rows"] == len(source_ids_to_delete)
+        assert result["shards"] == 2
+
+    for table in tables:
+        table_name = table["name"]
+        ids_deleted_row = sync.sql.select_one_row(cur=cur_target,
+                                                  sql=f"SELECT COUNT(id) AS qty FROM {table_name} "
+                                                      f"WHERE id IN ({sql_ids_params})",
+                                                  params=source_ids_to_delete
+                                                  )
+        assert ids_deleted_row["qty"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_delete_checksum():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    # small leaves, forces the ranges to be split
+    config.db_delete_limit_select = 4
+    config.db_delete_limit = 10
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified", "delete_method": "checksum"},
+    ]
+
+    source_ids_to_delete = [13, 61, 62, 97]
+    param_style = sql.get_param_style("position")
+    sql_ids_params = ','.join([param_style] * len(source_ids_to_delete))
+    for table in tables:
+        table_name = table["name"]
+        nbr_rows_deleted = sql.execute(cur=cur_source,
+                                       sql=f"DELETE FROM {table_name} WHERE id IN ({sql_ids_params})",
+                                       params=source_ids_to_delete
+                                       )
+        assert nbr_rows_deleted == len(source_ids_to_delete)
+
+    sync = Sync(config, log, sql)
+    results = sync.delete(tables)
+    for result in results:
+        assert result["nbr_rows"] == len(source_ids_to_delete)
+
+    for table in tables:
+        table_name = table["name"]
+        row = sql.select_one_row(cur=cur_target,
+                                 sql=f"SELECT COUNT(id) AS qty FROM {table_name} WHERE id IN ({sql_ids_params})",
+                                 params=source_ids_to_delete
+                                 )
+        assert row["qty"] == 0
+
+    # in sync, single range checksum
+    sync = Sync(config, log, sql)
+    results = sync.delete(tables)
+    for result in results:
+        assert result["nbr_rows"] == 0
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_delete_checksum_offset_ids():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 1000
+    config.db_delete_limit = 10
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+    param_style = sql.get_param_style("position")
+
+    # 4 consecutive ids in sync, x + (x + 3) == (x + 1) + (x + 2)
+    cur_target = sql.select(cur=cur_target, sql="SELECT id FROM test_table_1 ORDER BY id")
+    target_ids = [row["id"] for row in cur_target]
+    cur_source = sql.select(cur=cur_source, sql="SELECT id FROM test_table_1 ORDER BY id")
+    source_ids = set([row["id"] for row in cur_source])
+    first_id = next(row_id for row_id in target_ids
+                    if all([row_id + offset in source_ids and row_id + offset in target_ids for offset in range(4)]))
+
+    # rows missed by the target, and rows deleted in the source, same count and sum of ids
+    target_missing_ids = [first_id + 1, first_id + 2]
+    source_deleted_ids = [first_id, first_id + 3]
+    for cur, ids in ((cur_target, target_missing_ids), (cur_source, source_deleted_ids)):
+        sql.execute(cur=cur, sql=f"DELETE FROM test_table_1 WHERE id IN ({param_style}, {param_style})", params=ids)
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified", "delete_method": "checksum"},
+    ]
+    sync = Sync(config, log, sql)
+    results = sync.delete(tables)
+    for result in results:
+        assert result["nbr_rows"] == len(source_deleted_ids)
+
+    row = sql.select_one_row(cur=cur_target,
+                             sql=f"SELECT COUNT(id) AS qty FROM test_table_1 WHERE id IN ({param_style}, {param_style})",
+                             params=source_deleted_ids
+                             )
+    assert row["qty"] == 0
+
+    # back in sync for the next tests
+    cur_source = sql.select(cur=cur_source,
+                            sql=f"SELECT * FROM test_table_1 WHERE id IN ({param_style}, {param_style})",
+                            params=target_missing_ids
+                            )
+    rows = [row for row in cur_source]
+    sql.insert_many(cur=cur_target, table_name="test_table_1", field_names=list(rows[0].keys()),
+                    rows=[tuple(row.values()) for row in rows])
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_delete_sparse():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_delete_limit = 10
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+    param_style = sql.get_param_style("position")
+
+    # far above the other ids, target only
+    target_ids_to_delete = [10 ** 9, 10 ** 9 + 7]
+    for row_id in target_ids_to_delete:
+        sql.execute(cur=cur_target, sql=f"INSERT INTO test_table_1 (id, name) VALUES ({param_style}, 'sparse')",
+                    params=(row_id,))
+
+    # text primary key
+    table_name = "test_scratch_delete_code"
+    for cur in (cur_source, cur_target):
+        sql.execute(cur=cur, sql=f"DROP TABLE IF EXISTS {table_name}")
+        sql.execute(cur=cur, sql=f"CREATE TABLE {table_name} (code VARCHAR(16) NOT NULL PRIMARY KEY)")
+    codes = [f"code {i:02}" for i in range(25)]
+    sql.insert_many(cur=cur_source, table_name=table_name, field_names=["code"],
+                    rows=[(code,) for code in codes if code not in ("code 03", "code 17")])
+    sql.insert_many(cur=cur_target, table_name=table_name, field_names=["code"], rows=[(code,) for code in codes])
+
+    tables = [
+        {"name": "test_table_1", "modified_field": "modified"},
+        {"name": table_name, "primary_field": "code"},
+    ]
+    sync = Sync(config, log, sql)
+    results = sync.delete(tables)
+    for result in results:
+        assert result["nbr_rows"] == 2
+
+    row = sql.select_one_row(cur=cur_target, sql=f"SELECT COUNT(code) AS qty FROM {table_name}")
+    assert row["qty"] == 23
+    row = sql.select_one_row(cur=cur_target, sql="SELECT COUNT(id) AS qty FROM test_table_1 WHERE name = 'sparse'")
+    assert row["qty"] == 0
+
+    for cur in (cur_source, cur_target):
+        sql.execute(cur=cur, sql=f"DROP TABLE IF EXISTS {table_name}")
+    conn_source.close()
+    conn_target.close()
+
+
+def test_delete_ids_diff():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    sync_delete = SyncDelete(config, log, sql)
+
+    # merge join of ascending integer ids, including gaps either side and an exhausted source
+    ids_to_delete = sync_delete._get_ids_to_delete(source_ids=[2, 3, 5, 9], target_ids=[1, 2, 3, 4, 5, 6, 10, 11])
+    assert ids_to_delete == [1, 4, 6, 10, 11]
+    assert sync_delete._get_ids_to_delete(source_ids=[], target_ids=[1, 2]) == [1, 2]
+    assert sync_delete._get_ids_to_delete(source_ids=[1, 2], target_ids=[]) == []
+    # other keys compared by set, order from the database collation
+    assert sync_delete._get_ids_to_delete(source_ids=["b", "A"], target_ids=["a", "A", "b", "C"]) == ["a", "C"]
+
+
+def test_stats():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_stats = True
+
+    with tempfile.TemporaryDirectory() as stats_dir:
+        config.db_stats_file = os.path.join(stats_dir, "sync_stats.json")
+        tables = setup_tests.get_tables("delete")
+
+        # one Sync, pool reused across runs
+        sync = Sync(config, log, sql)
+        sync.delete(tables)
+        results = sync.delete(tables)
+        for result in results:
+            assert result["nbr_rows"] == 0
+            assert result["elapsed"] >= 0
+
+        stats = sync.sync_stats.load()
+        assert len(stats) == 2
+        for table in tables:
+            assert stats[sync.sync_stats.get_name("delete", table["name"])]["nbr_rows"] == 0
+
+        # longest first, tables without stats before both
+        stats[sync.sync_stats.get_name("delete", "test_table_1")]["elapsed"] = 1.0
+        stats[sync.sync_stats.get_name("delete", "test_table_2")]["elapsed"] = 3.0
+        with open(config.db_stats_file, "wb") as file:
+            file.write(orjson.dumps(stats))
+        tasks = sync.sync_stats.order(tables + [{"name": "test_table_3"}], "delete")
+        assert [task["name"] for task in tasks] == ["test_table_3", "test_table_2", "test_table_1"]
+        # per range task
+        tasks = sync.sync_stats.order([{"name": "test_table_1"}, {"name": "test_table_2", "shards": 4}], "delete")
+        assert [task["name"] for task in tasks] == ["test_table_1", "test_table_2"]
+
+
+def test_full():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_delete_limit = 10
+    config.db_insert_limit_select = 1000
+    config.db_insert_limit = 1000
+    config.db_update_limit_select = 1000
+    config.db_update_limit = 1000
+    # no compare, every modified row in the window is written
+    config.db_update_compare_method = "none"
+    config.db_update_modified_from_date = "1 hour ago utc"
+    config.max_threads = 2
+
+    conn_source, cur_source = sql.connect_to_source()
+    conn_target, cur_target = sql.connect_to_target()
+
+    # new source rows in both tables, test_table_2 not yet inserted in target; deleted source row
+    setup_tests.add_test_data(cur_source, "test_table_1", {"name": "string", "address": "string"}, 5)
+    setup_tests.add_test_data(cur_source, "test_table_2", {"item": "string", "price": "decimal"}, 5)
+    row = sql.select_one_row(cur=cur_target, sql="SELECT MAX(id) AS max_id FROM test_table_1")
+    max_target_id = row["max_id"]
+    row = sql.select_one_row(cur=cur_target, sql="SELECT MIN(id) AS min_id FROM test_table_1")
+    param_style = sql.get_param_style("position")
+    sql.execute(cur=cur_source, sql=f"DELETE FROM test_table_1 WHERE id = {param_style}", params=(row["min_id"],))
+
+    sync = Sync(config, log, sql)
+    sync.get_tables = setup_tests.get_tables
+
+    # record updated ids
+    updated_ids = []
+    execute = sync.sql.execute
+
+    def execute_update(cur, sql, params=(), commit=True):
+        if sql.startswith("UPDATE test_table_1"):
+            updated_ids.append(params[-1])
+        return execute(cur=cur, sql=sql, params=params, commit=commit)
+
+    sync.sql.execute = execute_update
+    results = sync.full()
+    sync.sql.execute = execute
+    insert_results, update_results, delete_results = results
+    for result in insert_results:
+        assert result["nbr_rows"] >= 5
+    # rows inserted by this run not updated again
+    assert len(update_results) == 2
+    assert updated_ids
+    assert max(updated_ids) <= max_target_id
+    delete_rows = {result["name"]: result["nbr_rows"] for result in delete_results}
+    assert delete_rows == {"test_table_1": 1, "test_table_2": 0}
+
+    for table_name in ("test_table_1", "test_table_2"):
+        sql_count = f"SELECT COUNT(id) AS qty, SUM(id) AS sum_id FROM {table_name}"
+        source_row = sql.select_one_row(cur=cur_source, sql=sql_count)
+        target_row = sql.select_one_row(cur=cur_target, sql=sql_count)
+        assert source_row == target_row
+
+    conn_source.close()
+    conn_target.close()
+
+
+def test_engine_async():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_insert_limit = 1000
+    config.engine = "async"
+
+    conn_source, cur_source = sql.connect_to_source()
+    setup_tests.add_test_data(cur_source, "test_table_2", {"item": "string", "price": "decimal"}, 3)
+    conn_source.close()
+
+    sync = Sync(config, log, sql)
+    sync.get_tables = setup_tests.get_tables
+    tables = setup_tests.get_tables("delete")
+    results = sync.delete(tables)
+    assert sorted([result["name"] for result in results]) == ["test_table_1", "test_table_2"]
+
+    insert_results, update_results, delete_results = sync.full()
+    insert_rows = {result["name"]: result["nbr_rows"] for result in insert_results}
+    assert insert_rows == {"test_table_1": 0, "test_table_2": 3}
+    assert len(update_results) == 2
+    for result in delete_results:
+        assert result["nbr_rows"] == 0
+
+
+def test_engine_process():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_delete_limit_select = 10
+    config.db_delete_limit = 10
+    config.engine = "process"
+
+    conn_source, cur_source = sql.connect_to_source()
+    row = sql.select_one_row(cur=cur_source, sql="SELECT MAX(id) AS max_id FROM test_table_2")
+    param_style = sql.get_param_style("position")
+    sql.execute(cur=cur_source, sql=f"DELETE FROM test_table_2 WHERE id = {param_style}", params=(row["max_id"] - 1,))
+    conn_source.close()
+
+    # worker processes with their own connections
+    sync = Sync(config, log, sql)
+    sync.get_tables = setup_tests.get_tables
+    results = sync.delete(setup_tests.get_tables("delete"))
+    delete_rows = {result["name"]: result["nbr_rows"] for result in results}
+    assert delete_rows == {"test_table_1": 0, "test_table_2": 1}
+
+    insert_results, update_results, delete_results = sync.full()
+    assert len(insert_results) == 2
+    for result in delete_results:
+        assert result["nbr_rows"] == 0
+
+
+def test_pool_first_failure():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.max_threads = 2
+
+    started = []
+
+    def submit_function(table):
+        started.append(table["name"])
+        if table["name"] == "test_table_failed":
+            raise ValueError(f"{table['name']} failed")
+        # may still be running when the first task fails
+        time.sleep(0.2)
+        return {"name": table["name"], "nbr_rows": 0}
+
+    for scheduler in (SyncThread, SyncAsync):
+        config.engine = "async" if scheduler is SyncAsync else "thread"
+        sync_thread = scheduler(config, log)
+
+        # queued tasks are not run after the first failure
+        started.clear()
+        tables = [{"name": "test_table_failed"}, {"name": "test_table_1"}, {"name": "test_table_2"}]
+        with pytest.raises(Exception):
+            sync_thread.pool(tables, submit_function, lambda future: None)
+        assert "test_table_failed" in started and "test_table_2" not in started
+
+        started.clear()
+        chains = [[{"action": "insert", "tasks": [table], "submit_function": submit_function,
+                    "callback_function": lambda future: None}] for table in tables]
+        with pytest.raises(Exception):
+            sync_thread.pool_chains(chains)
+        assert "test_table_failed" in started and "test_table_2" not in started
+
+        # same scheduler used by the next action, no results left from the failed call
+        started.clear()
+        results = sync_thread.pool(tables[1:], submit_function, lambda future: None)
+        assert sorted([result["name"] for result in results]) == ["test_table_1", "test_table_2"]
+        assert sorted(started) == ["test_table_1", "test_table_2"]
+
+
+def test_throttle():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_throttle_statements_per_sec = 20
+    sync_throttle = SyncThrottle.from_config(config, log)
+
+    # no table limits, global throttle
+    table = {"name": "test_table_1"}
+    assert sync_throttle.for_table(table) is sync_throttle
+
+    # burst of 1 second of statements, then 10 more at 20/sec
+    start = time.perf_counter()
+    for _ in range(30):
+        sync_throttle.wait(statements=1)
+    elapsed = time.perf_counter() - start
+    assert 0.4 <= elapsed < 2
+
+    # table rows limit, global statements limit still applies
+    table = {"name": "test_table_1", "throttle_rows_per_sec": 100}
+    table_throttle = sync_throttle.for_table(table)
+    assert table_throttle is not sync_throttle
+    assert table_throttle.is_limited("rows")
+    assert table_throttle.is_limited("statements")
+    assert not table_throttle.is_limited("bytes")
+    assert table_throttle.get_nbytes([("abc", 1)]) == 0
+
+    # range tasks of a table share its bucket
+    range_table = {"name": "test_table_1", "throttle_rows_per_sec": 100, "range_start": 10, "range_end": 20}
+    assert sync_throttle.for_table(range_table) is table_throttle
+    assert sync_throttle.for_table({"name": "test_table_2", "throttle_rows_per_sec": 100}) is not table_throttle
+
+
+def test_pool_failed_tasks():
+    setup_tests = SetupTests()
+    config, log, sql = setup_tests.get_setup()
+    config.db_pool = True
+    config.max_threads = 2
+    # pools of this process
+    config.engine = "thread"
+
+    # more failing tasks than pooled connections, each fails after acquiring
+    sync = Sync(config, log, sql)
+    tables = [{"name": f"test_table_missing_{nbr}", "modified_field": "modified"} for nbr in range(3)]
+    for action in (sync.insert, sync.update, sync.delete):
+        with pytest.raises(Exception):
+            action(tables)
+
+        # all connections released
+        for name in ("source", "target"):
+            pool = sql.pools[name]
+            assert all([pool.available.acquire(blocking=False) for _ in range(config.max_threads)])
+            for _ in range(config.max_threads):
+                pool.available.release()
+
+    sql.close_pools()
+
+
 def test_done():
     assert 1 == 1
@@ -15,6 +15,11 @@ class Config:
         self.log_sql = False
 
         self.max_threads = 2
+        self.engine = "thread"
+        self.db_stats = False
+        self.db_stats_file = "sync_stats.json"
+
+        self.db_pool = True
 
         self.db_primary_field = "id"
 
@@ -23,13 +28,36 @@ class Config:
         self.db_update_modified_from_date = "today"
         self.db_update_compare_method = "none"
         self.db_update_limit = 1
+        self.db_update_batch_size = 1000
+        self.db_update_method = "update"
+        self.db_update_changed_fields = False
+        self.db_update_checkpoint = False
+        self.db_update_checkpoint_file = "sync_checkpoints.db"
+        self.db_update_checkpoint_overlap = 60
 
         self.db_insert_limit_select = 10000
         self.db_insert_batch_size = 1000
         self.db_insert_limit = 1
+        self.db_insert_method = "values"
+
+        self.db_max_params = 0
+
+        self.db_commit_interval = 0
+
+        self.db_shards = 1
+        self.db_shard_method = "minmax"
+
+        self.db_throttle_rows_per_sec = 0
+        self.db_throttle_statements_per_sec = 0
+        self.db_throttle_bytes_per_sec = 0
+
+        self.db_pipeline = False
+        self.db_pipeline_queue_size = 4
 
         self.db_delete_limit_select = 10000
         self.db_delete_limit = 1
+        self.db_delete_batch_size = 1000
+        self.db_delete_method = "scan"
 
         self.db_source_name = ""
         self.db_source_host = ""
@@ -48,6 +76,7 @@ class Config:
         self.db_target_user = ""
         self.db_target_password = ""
         self.db_target_file = ""
+        self.db_target_local_infile = False
 
         self.batch_insert_row_size = 0
 
@@ -66,13 +95,27 @@ class Config:
         # max cpu threads
         # nbr of processes (insert/update/delete) to run at once
         self.max_threads = int(os.getenv("MAX_THREADS", 2))
+        # task scheduler; "thread"|"async"|"process"
+        # "async" asyncio event loop, chains of a full sync as coroutines; db work still in MAX_THREADS threads
+        # "process" MAX_THREADS worker processes, each with its own connections; for cpu bound hashing and diffing
+        self.engine = os.getenv("ENGINE", "thread")
+        # 1|True=record per table insert/update/delete durations and row counts, and run the longest tables first
+        # tables without stats run first, in sync_tables_[action].json order
+        self.db_stats = os.getenv("DB_STATS", "False").lower() in ('true', '1', 't')
+        # json stats file, relative to the main dir
+        self.db_stats_file = os.getenv("DB_STATS_FILE", "sync_stats.json")
+
+        # 1|True=reuse source and target connections across tables and insert/update/delete
+        # pools hold up to MAX_THREADS connections per database
+        self.db_pool = os.getenv("DB_POOL", "True").lower() in ('true', '1', 't')
 
         # primary key, often id or code
         # if empty, specify in table structure
         self.db_primary_field = os.getenv("DB_PRIMARY_FIELD", "id")
 
-        # update: max number of rows to select/modified for update per table
-        # sql limit
+        # update: max number of rows to select/modified for update per page
+        # sql limit; pages are selected by (modified, primary) until DB_UPDATE_LIMIT reached
+        # an index on the source (modified, primary) avoids a table scan per page
         self.db_update_limit_select = int(os.getenv("DB_UPDATE_LIMIT_SELECT", 10000))
         # update: row last updated
         # timestamp NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
@@ -80,24 +123,94 @@ class Config:
         self.db_update_modified_field = os.getenv("DB_UPDATE_MODIFIED_FIELD")
         # update: dateparser date, update rows >= date
         self.db_update_modified_from_date = os.getenv("DB_UPDATE_MODIFIED_FROM_DATE", "today")
-        # update: compare rows between source and target before update; "none"|"timestamp"
+        # update: compare rows between source and target before update; "none"|"timestamp"|"hash"
+        # "hash" md5 over all non primary fields, in sql for mysql|mariadb|postgres, in python for sqlite
         self.db_update_compare_method = os.getenv("DB_UPDATE_COMPARE_METHOD")
 
         # update: max number of rows to update per table
         self.db_update_limit = int(os.getenv("DB_UPDATE_LIMIT", 1))
-
-        # insert: max number of rows to select/primary for insert per table
-        # sql limit; due to gaps in ids, may result in less actual rows
+        # update: rows per batch passed from source reader to target writer
+        self.db_update_batch_size = int(os.getenv("DB_UPDATE_BATCH_SIZE", 1000))
+        # update: how changed rows are written; "update"|"upsert"
+        # "update" one UPDATE ... WHERE primary = ? stmt per row
+        # "upsert" one multi-row insert per batch, INSERT ... ON CONFLICT DO UPDATE for sqlite 3.24+ and postgres,
+        # ON DUPLICATE KEY UPDATE for mysql|mariadb; changed rows missing from the target are inserted
+        # can also specify in table structure
+        self.db_update_method = os.getenv("DB_UPDATE_METHOD", "update")
+        # update: 1|True=set only the fields that differ, instead of all non primary fields
+        # requires DB_UPDATE_COMPARE_METHOD "hash", which then selects one digest per field; "update" method only
+        self.db_update_changed_fields = os.getenv("DB_UPDATE_CHANGED_FIELDS", "False").lower() in ('true', '1', 't')
+
+        # update: 1|True=continue each run after the highest (modified, primary) applied by the previous run
+        # instead of rescanning from DB_UPDATE_MODIFIED_FROM_DATE; the first run still uses the from date
+        # rows are applied in (modified, primary) order, so a run stopped by DB_UPDATE_LIMIT continues after its last row
+        self.db_update_checkpoint = os.getenv("DB_UPDATE_CHECKPOINT", "False").lower() in ('true', '1', 't')
+        # update: sqlite3 checkpoint state file, relative to the main dir
+        self.db_update_checkpoint_file = os.getenv("DB_UPDATE_CHECKPOINT_FILE", "sync_checkpoints.db")
+        # update: seconds before the checkpoint to rescan, for rows committed late or clock skew
+        # 0=strictly after the checkpoint (modified, primary); also after a run stopped by DB_UPDATE_LIMIT
+        self.db_update_checkpoint_overlap = int(os.getenv("DB_UPDATE_CHECKPOINT_OVERLAP", 60))
+
+        # insert: max number of rows to select/primary per page for insert per table
+        # sql limit; pages are selected by primary key until DB_INSERT_LIMIT reached
         self.db_insert_limit_select = int(os.getenv("DB_INSERT_LIMIT_SELECT", 10000))
         # insert: max rows to batch insert in one sql stmt
         self.db_insert_batch_size = int(os.getenv("DB_INSERT_BATCH_SIZE", 1000))
         # insert: max number of rows to insert per table
         self.db_insert_limit = int(os.getenv("DB_INSERT_LIMIT", 1))
 
+        # insert: how batches are written; "values"|"copy"|"load_data"|"executemany"
+        # "values" one multi-row INSERT ... VALUES (...),(...) stmt per chunk of rows
+        # "copy" postgres only, COPY FROM STDIN per batch
+        # "load_data" mysql|mariadb only, LOAD DATA LOCAL INFILE per batch, requires DB_TARGET_LOCAL_INFILE
+        # "executemany" driver executemany, often one stmt per row
+        # can also specify in table structure
+        self.db_insert_method = os.getenv("DB_INSERT_METHOD", "values")
+
+        # max bound parameters per multi-row stmt; 0=engine default, eg sqlite 32766, mysql 65535
+        # lower to keep mysql stmts under max_allowed_packet for wide tables
+        self.db_max_params = int(os.getenv("DB_MAX_PARAMS", 0))
+
+        # update: commit every n rows written; 0=commit once per batch
+        # a failed batch rolls back its uncommitted rows; inserts commit once per batch, deletes once per DB_DELETE_BATCH_SIZE ids
+        self.db_commit_interval = int(os.getenv("DB_COMMIT_INTERVAL", 0))
+
+        # split each table into this many primary key ranges, each range a separate thread task
+        # 1=no split; can also specify "shards" in table structure
+        # update and delete limits are split evenly across ranges; insert ranges cover the next DB_INSERT_LIMIT ids
+        self.db_shards = int(os.getenv("DB_SHARDS", 1))
+        # "minmax" equal id ranges between MIN and MAX, integer primary keys only
+        # "quantile" equal row count ranges using NTILE, any primary key type, but scans the key index
+        # can also specify "shard_method" in table structure
+        self.db_shard_method = os.getenv("DB_SHARD_METHOD", "minmax")
+
+        # throttle across all threads; 0=unlimited
+        # rows written per second, sql stmts (selects and writes) per second, approx row value bytes written per second
+        # can also specify "throttle_rows_per_sec", "throttle_statements_per_sec", "throttle_bytes_per_sec" in
+        # table structure, which apply per table in addition to the global limits
+        self.db_throttle_rows_per_sec = int(os.getenv("DB_THROTTLE_ROWS_PER_SEC", 0))
+        self.db_throttle_statements_per_sec = int(os.getenv("DB_THROTTLE_STATEMENTS_PER_SEC", 0))
+        self.db_throttle_bytes_per_sec = int(os.getenv("DB_THROTTLE_BYTES_PER_SEC", 0))
+
+        # 1|True=per table, read source batches on a separate thread and connection while writing target batches
+        # overlaps source and target latency, useful across slow links
+        self.db_pipeline = os.getenv("DB_PIPELINE", "False").lower() in ('true', '1', 't')
+        # max batches read ahead of the writer; limits memory per table to queue size * batch size
+        self.db_pipeline_queue_size = int(os.getenv("DB_PIPELINE_QUEUE_SIZE", 4))
+
         # delete: max number of rows to select/compare for delete per table
+        # sql limit; pages of target ids are selected by primary key, from the lowest target id
         self.db_delete_limit_select = int(os.getenv("DB_DELETE_LIMIT_SELECT", 10000))
         # delete: max number of rows to delete per table
         self.db_delete_limit = int(os.getenv("DB_DELETE_LIMIT", 1))
+        # delete: max ids per DELETE ... IN (...) stmt, each its own transaction; capped by the engine bound parameter limit
+        self.db_delete_batch_size = int(os.getenv("DB_DELETE_BATCH_SIZE", 1000))
+        # delete: how ids missing from the source are found; "scan"|"checksum"
+        # "scan" compare all ids of both sides, DB_DELETE_LIMIT_SELECT ids per select
+        # "checksum" compare COUNT and SUM of ids per range on both sides, split only ranges that differ,
+        # ids selected only for differing ranges of up to DB_DELETE_LIMIT_SELECT target rows; integer primary keys only
+        # can also specify in table structure
+        self.db_delete_method = os.getenv("DB_DELETE_METHOD", "scan")
 
         # sqlite3|mysql|mariadb|postgres
         self.db_engine = os.getenv("DB_ENGINE")
@@ -117,6 +230,9 @@ class Config:
         self.db_target_user = os.getenv("DB_TARGET_USER")
         self.db_target_password = os.getenv("DB_TARGET_PASSWORD")
         self.db_target_file = os.getenv("DB_TARGET_FILE")
+        # 1|True=allow LOAD DATA LOCAL INFILE on target connections, mysql|mariadb only
+        # server must also allow local_infile
+        self.db_target_local_infile = os.getenv("DB_TARGET_LOCAL_INFILE", "False").lower() in ('true', '1', 't')
 
 
 def main():
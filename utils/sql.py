@@ -1,11 +1,17 @@
+import hashlib
+import io
 import os
+import queue
 import re
+import tempfile
+import threading
 import time
+from math import ceil
 from typing import LiteralString
 
 import sqlite3
 import MySQLdb
-from MySQLdb.cursors import SSDictCursor
+from MySQLdb.cursors import SSDictCursor, SSCursor
 import psycopg2
 import psycopg2.extras
 import mariadb
@@ -13,7 +19,145 @@ import mysql.connector
 
 
 
+class SqlBatch:
+    # batch of rows kept as one flat list of values in field order
+    # no dict or tuple per row, and multi-row stmt params are a direct slice
+    def __init__(self, field_names):
+        self.field_names = field_names
+        self.nbr_fields = len(field_names)
+        self.values = []
+
+    def __len__(self):
+        return len(self.values) // self.nbr_fields
+
+    def __iter__(self):
+        nbr_fields = self.nbr_fields
+        values = self.values
+        for start in range(0, len(values), nbr_fields):
+            yield values[start:start + nbr_fields]
+
+    def append(self, row):
+        self.values.extend(row)
+
+    def clear(self):
+        self.values = []
+
+    def get_values(self, start_row, end_row):
+        return self.values[start_row * self.nbr_fields:end_row * self.nbr_fields]
+
+
+class SqlPool:
+    # thread safe pool of open connections to one database, source or target
+    def __init__(self, sql, name, connect, size):
+        self.sql = sql
+        self.log = sql.log
+        self.name = name
+        self.connect = connect
+        self.size = size
+        if self.size <= 0:
+            raise ValueError(f"SqlPool: {name} size {self.size} must be 1 or greater")
+
+        # most recently used first, older idle connections may time out
+        self.idle = queue.LifoQueue()
+        # blocks when all connections are in use
+        self.available = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def acquire(self):
+        self.available.acquire()
+        try:
+            while True:
+                try:
+                    conn = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                try:
+                    cur = self.sql.get_cursor(conn)
+                    if self.sql.ping(conn, cur):
+                        return conn, cur
+                except Exception as e:
+                    self.log.warning(f"SqlPool: {self.name} cursor exception", e=e)
+                self.log.warning(f"SqlPool: {self.name} connection failed health check, reconnecting")
+                self.sql.close(conn)
+        except Exception:
+            self.available.release()
+            raise
+
+    def release(self, conn, cur=None):
+        # reset before reuse; drop unread results and any uncommitted changes
+        try:
+            if cur is not None:
+                cur.close()
+            conn.rollback()
+            with self.lock:
+                if self.closed:
+                    conn.close()
+                else:
+                    self.idle.put(conn)
+        except Exception as e:
+            self.log.warning(f"SqlPool: {self.name} connection reset failed, closing", e=e)
+            self.sql.close(conn)
+        finally:
+            self.available.release()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            while True:
+                try:
+                    conn = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                self.sql.close(conn)
+
+
+class SqlTransaction:
+    # explicit transaction over one cursor; commit every commit_interval rows and on exit, rollback on exception
+    # 0 = commit once on exit
+    def __init__(self, sql, cur, commit_interval=0):
+        self.sql = sql
+        self.cur = cur
+        self.commit_interval = commit_interval
+        self.nbr_rows = 0
+        self.nbr_commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # keep the original exception if the connection is already gone
+            try:
+                self.rollback()
+            except Exception as e:
+                self.sql.log.warning("SqlTransaction: rollback failed", e=e)
+        else:
+            self.commit()
+        return False
+
+    def add(self, nbr_rows=1):
+        # rows written since the last commit
+        self.nbr_rows += nbr_rows
+        if 0 < self.commit_interval <= self.nbr_rows:
+            self.commit()
+
+    def commit(self):
+        if self.nbr_rows == 0:
+            return
+        self.sql.commit(self.cur)
+        self.nbr_rows = 0
+        self.nbr_commits += 1
+
+    def rollback(self):
+        self.sql.rollback(self.cur)
+        self.nbr_rows = 0
+
+
 class Sql:
+    # postgres COPY text format escapes
+    COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
     def __init__(self, config, log):
         self.config = config
         self.log = log
@@ -21,6 +165,10 @@ class Sql:
         self.log_sql = self.config.log_sql
         self.param_style = "?"
 
+        # source|target connection pools, reused across tables and actions
+        self.pools = {}
+        self.pools_lock = threading.Lock()
+
     def _log(self, prefix, data, nbr_rows=None, start=0.0):
         if not self.log_sql:
             return
@@ -48,7 +196,7 @@ class Sql:
         # TODO sanitize common pwd params
         self._log("SQL execute", {"sql": sql, "params": params}, nbr_rows, start)
 
-    def _connect(self, host, port, dbname, user, password, db_file):
+    def _connect(self, host, port, dbname, user, password, db_file, local_infile=False):
         match self.config.db_engine:
             case "sqlite3":
                 return self._connect_sqlite3_pkg(db_file)
@@ -59,6 +207,7 @@ class Sql:
                     dbname=dbname,
                     user=user,
                     password=password,
+                    local_infile=local_infile,
                 )
             case "postgres":
                 return self._connect_psycopg2_pkg(
@@ -81,7 +230,8 @@ class Sql:
         # used for testing
         start = time.perf_counter()
         try:
-            conn = sqlite3.connect(db_file)
+            # pooled connections may be used by another thread, one thread at a time
+            conn = sqlite3.connect(db_file, check_same_thread=not self.config.db_pool)
 
             # return dict instead of tuple
             # conn.row_factory = sqlite3.Row
@@ -99,7 +249,7 @@ class Sql:
 
     # https://pypi.org/project/mysqlclient/#files
     # https://mysqlclient.readthedocs.io/
-    def _connect_mysqldb_pkg(self, host, port, dbname, user, password):
+    def _connect_mysqldb_pkg(self, host, port, dbname, user, password, local_infile=False):
         # server side cursors
         start = time.perf_counter()
         try:
@@ -111,6 +261,7 @@ class Sql:
                 password=password,
                 compress=True,
                 cursorclass=SSDictCursor,
+                local_infile=local_infile,
             )
 
             cur = conn.cursor()
@@ -182,6 +333,114 @@ class Sql:
             self.log.error(f"_connect database.Error:", e=e)
             raise Exception(e)
 
+    def get_cursor(self, conn):
+        # default cursor; rows as dicts
+        match self.config.db_engine:
+            case "postgres":
+                return conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            case _:
+                # sqlite3 row_factory and MySQLdb cursorclass set on connect
+                return conn.cursor()
+
+    def ping(self, conn, cur):
+        # connection health check
+        try:
+            match self.config.db_engine:
+                case "mysql" | "mariadb":
+                    conn.ping()
+                case _:
+                    cur.execute("SELECT 1")
+                    cur.fetchall()
+            return True
+        except Exception as e:
+            self.log.warning("ping: exception", e=e)
+            return False
+
+    def close(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            self.log.warning("close: exception", e=e)
+
+    def _get_pool(self, name, connect):
+        with self.pools_lock:
+            if name not in self.pools:
+                # one connection per thread per database
+                self.pools[name] = SqlPool(self, name, connect, self.config.max_threads)
+            return self.pools[name]
+
+    def acquire_source(self):
+        # pooled source connection; return with release_source
+        if not self.config.db_pool:
+            return self.connect_to_source()
+        return self._get_pool("source", self.connect_to_source).acquire()
+
+    def release_source(self, conn, cur=None):
+        if not self.config.db_pool:
+            conn.close()
+            return
+        self._get_pool("source", self.connect_to_source).release(conn, cur)
+
+    def acquire_target(self):
+        # pooled target connection; return with release_target
+        if not self.config.db_pool:
+            return self.connect_to_target()
+        return self._get_pool("target", self.connect_to_target).acquire()
+
+    def release_target(self, conn, cur=None):
+        if not self.config.db_pool:
+            conn.close()
+            return
+        self._get_pool("target", self.connect_to_target).release(conn, cur)
+
+    def close_pools(self):
+        with self.pools_lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools = {}
+
+    def commit(self, cur):
+        if self.config.dry_run:
+            return
+        try:
+            cur.connection.commit()
+        except Exception as e:
+            self.log.error("commit: exception", e=e)
+            raise Exception(e)
+
+    def rollback(self, cur):
+        if self.config.dry_run:
+            return
+        try:
+            cur.connection.rollback()
+        except Exception as e:
+            self.log.error("rollback: exception", e=e)
+            raise Exception(e)
+
+    def transaction(self, cur, commit_interval=None):
+        # with sql.transaction(cur) as transaction: execute(..., commit=False), transaction.add(nbr_rows)
+        if commit_interval is None:
+            commit_interval = self.config.db_commit_interval
+        return SqlTransaction(self, cur, commit_interval)
+
+    def get_tuple_cursor(self, conn):
+        # rows as tuples in cursor.description order, avoids building a dict per row
+        match self.config.db_engine:
+            case "sqlite3":
+                cur = conn.cursor()
+                cur.row_factory = None
+            case "mysql" | "mariadb":
+                cur = conn.cursor(SSCursor)
+            case "postgres":
+                cur = conn.cursor()
+            case _:
+                raise NotImplementedError(f"get_tuple_cursor: Unknown database engine: {self.config.db_engine}")
+        return cur
+
+    def get_field_names(self, cur):
+        # field order of the last select
+        return [column[0] for column in cur.description]
+
     def connect_to_source(self):
         return self._connect(
             host=self.config.db_source_host,
@@ -199,7 +458,8 @@ class Sql:
             dbname=self.config.db_target_dbname,
             user=self.config.db_target_user,
             password=self.config.db_target_password,
-            db_file=self.config.db_target_file
+            db_file=self.config.db_target_file,
+            local_infile=self.config.db_target_local_infile
         )
 
     def get_param_style(self, param_type):
@@ -226,6 +486,99 @@ class Sql:
                 param_placeholder = f"%({field_name})s"
         return param_placeholder
 
+    def get_max_params(self):
+        # max bound parameters per sql stmt, limits rows per multi-row stmt
+        if self.config.db_max_params > 0:
+            return self.config.db_max_params
+        match self.config.db_engine:
+            case "sqlite3":
+                # SQLITE_MAX_VARIABLE_NUMBER; 999 before sqlite 3.32.0
+                if sqlite3.sqlite_version_info >= (3, 32, 0):
+                    return 32766
+                return 999
+            case "mysql" | "mariadb":
+                # prepared stmt placeholder limit; large rows may still need a lower
+                # DB_MAX_PARAMS to stay under max_allowed_packet
+                return 65535
+            case "postgres":
+                # Bind message Int16 parameter count
+                return 32767
+            case _:
+                raise NotImplementedError(f"get_max_params: Unknown database engine: {self.config.db_engine}")
+
+    def get_row_values(self, row):
+        # dict row -> values in field order; tuple|list row as is
+        if isinstance(row, dict):
+            return row.values()
+        return row
+
+    def get_table_field_names(self, cur, table_name):
+        # field order of a table, without selecting any rows
+        cur = self.select(cur=cur, sql=f"SELECT * FROM {table_name} WHERE 1 = 0")
+        cur.fetchall()
+        return self.get_field_names(cur)
+
+    def has_index(self, cur, table_name, field_name):
+        # True if an index starts with the field
+        match self.config.db_engine:
+            case "sqlite3":
+                indexes = self.select_all_rows(cur=cur, sql=f"PRAGMA index_list({table_name})")
+                for index in indexes:
+                    index_fields = self.select_all_rows(cur=cur, sql=f"PRAGMA index_info({index['name']})")
+                    for index_field in index_fields:
+                        if index_field["seqno"] == 0 and index_field["name"] == field_name:
+                            return True
+                return False
+            case "mysql" | "mariadb":
+                param_style = self.get_param_style("position")
+                row = self.select_one_row(cur=cur,
+                                          sql=f"SELECT COUNT(*) AS qty FROM information_schema.STATISTICS "
+                                              f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {param_style} "
+                                              f"AND COLUMN_NAME = {param_style} AND SEQ_IN_INDEX = 1",
+                                          params=(table_name, field_name,)
+                                          )
+                return row["qty"] > 0
+            case "postgres":
+                param_style = self.get_param_style("position")
+                row = self.select_one_row(cur=cur,
+                                          sql=f"SELECT COUNT(*) AS qty FROM pg_index i "
+                                              f"JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+                                              f"WHERE i.indrelid = {param_style}::regclass AND a.attname = {param_style}",
+                                          params=(table_name, field_name,)
+                                          )
+                return row["qty"] > 0
+            case _:
+                raise NotImplementedError(f"has_index: Unknown database engine: {self.config.db_engine}")
+
+    def get_row_hash_sql(self, field_names):
+        # md5 of all field values as an sql expression, None if the engine has no md5, see get_row_hash
+        # each value is prefixed with v, null is n, so null and '' differ; fields separated by 0x1f
+        match self.config.db_engine:
+            case "sqlite3":
+                return None
+            case "mysql" | "mariadb":
+                sql_values = ", ".join([f"COALESCE(CONCAT('v', {field_name}), 'n')" for field_name in field_names])
+                return f"MD5(CONCAT_WS(CHAR(31), {sql_values}))"
+            case "postgres":
+                # || instead of CONCAT_WS, which is limited to 100 args
+                sql_values = " || CHR(31) || ".join([f"COALESCE('v' || {field_name}::text, 'n')"
+                                                      for field_name in field_names])
+                return f"MD5({sql_values})"
+            case _:
+                raise NotImplementedError(f"get_row_hash_sql: Unknown database engine: {self.config.db_engine}")
+
+    def get_row_hash(self, values):
+        # md5 of row values in python; only comparable to other get_row_hash values, not to get_row_hash_sql
+        row_hash = hashlib.md5()
+        for value in values:
+            if value is None:
+                row_hash.update(b"n\x1f")
+                continue
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                value = bytes(value).hex()
+            row_hash.update(b"v" + str(value).encode("utf8") + b"\x1f")
+        return row_hash.hexdigest()
+
     def get_param_values(self, values):
         match self.param_style:
             case "?":
@@ -286,12 +639,13 @@ class Sql:
             self.log.error("select: exception", e=e)
             raise Exception(e)
 
-    def execute(self, cur, sql, params=()):
+    def execute(self, cur, sql, params=(), commit=True):
+        # commit=False when the caller commits, see transaction()
         start = time.perf_counter()
         try:
             if not self.config.dry_run:
                 rows_affected = cur.execute(sql, params)
-                if self.config.db_engine == "sqlite3":
+                if commit:
                     cur.connection.commit()
             else:
                 sql = f"Dryrun: {sql}"
@@ -312,7 +666,7 @@ class Sql:
             self.log.error("execute: exception", e=e)
             raise Exception(e)
 
-    def execute_many(self, cur, sql, params=()):
+    def execute_many(self, cur, sql, params=(), commit=True):
         start = time.perf_counter()
         nbr_params = len(params)
         if nbr_params == 0:
@@ -323,7 +677,7 @@ class Sql:
             if not self.config.dry_run:
                 rows_affected = cur.executemany(sql, params)
 
-                if self.config.db_engine == "sqlite3":
+                if commit:
                     cur.connection.commit()
             else:
                 sql = f"Dryrun: {sql}"
@@ -341,6 +695,221 @@ class Sql:
             self.log.error("execute_many: exception", e=e)
             raise Exception(e)
 
+    def insert_many(self, cur, table_name, field_names, rows, commit=True, sql_upsert=""):
+        # multi-row INSERT INTO t (a, b) VALUES (?, ?), (?, ?), ...
+        # one stmt per chunk of rows, chunk sized to the engine bound parameter limit
+        # sql_upsert appended to each stmt, see upsert_many
+        start = time.perf_counter()
+        nbr_rows = len(rows)
+        if nbr_rows == 0:
+            msg = "insert_many without any values"
+            self.log.error(msg)
+            raise ValueError(msg)
+
+        nbr_fields = len(field_names)
+        chunk_size = max(1, min(nbr_rows, self.get_max_params() // nbr_fields))
+        is_batch = isinstance(rows, SqlBatch)
+
+        param_style = self.get_param_style("position")
+        sql_field_names = ", ".join(field_names)
+        sql_row_values = "(" + ", ".join([param_style] * nbr_fields) + ")"
+        sql_insert = f"INSERT INTO {table_name} ({sql_field_names}) VALUES "
+        sql_chunk = ""
+        sql_chunk_size = 0
+        sql_log = f"{sql_insert}{sql_row_values} x {chunk_size}{sql_upsert}"
+
+        try:
+            rows_affected = 0
+            if not self.config.dry_run:
+                for chunk_start in range(0, nbr_rows, chunk_size):
+                    chunk_end = min(chunk_start + chunk_size, nbr_rows)
+                    nbr_chunk_rows = chunk_end - chunk_start
+                    if nbr_chunk_rows != sql_chunk_size:
+                        # full chunks share the same stmt, only the last chunk differs
+                        sql_chunk = sql_insert + ", ".join([sql_row_values] * nbr_chunk_rows) + sql_upsert
+                        sql_chunk_size = nbr_chunk_rows
+
+                    if is_batch:
+                        params = rows.get_values(chunk_start, chunk_end)
+                    else:
+                        params = []
+                        for row in rows[chunk_start:chunk_end]:
+                            params.extend(self.get_row_values(row))
+
+                    cur.execute(sql_chunk, params)
+                    rows_affected += cur.rowcount
+
+                # one commit per batch, not per chunk
+                if commit:
+                    cur.connection.commit()
+            else:
+                sql_log = f"Dryrun: {sql_log}"
+            self._log_execute(sql_log, nbr_rows, rows_affected, start)
+            return rows_affected
+        except Exception as e:
+            self.log.error("insert_many: exception", e=e)
+            raise Exception(e)
+
+    def delete_in(self, cur, table_name, field_name, ids):
+        # DELETE FROM t WHERE field IN (?, ?, ...), one stmt and transaction per chunk of ids
+        # chunk sized by DB_DELETE_BATCH_SIZE and the engine bound parameter limit; no stmt without ids
+        nbr_ids = len(ids)
+        if nbr_ids == 0:
+            return 0
+
+        chunk_size = max(1, min(nbr_ids, self.config.db_delete_batch_size, self.get_max_params()))
+        nbr_chunks = ceil(nbr_ids / chunk_size)
+        param_style = self.get_param_style("position")
+        sql_chunk = ""
+        sql_chunk_size = 0
+
+        rows_affected = 0
+        for chunk_nbr, chunk_start in enumerate(range(0, nbr_ids, chunk_size)):
+            start = time.perf_counter()
+            chunk_ids = ids[chunk_start:chunk_start + chunk_size]
+            if len(chunk_ids) != sql_chunk_size:
+                # full chunks share the same stmt, only the last chunk differs
+                sql_ids_params = ",".join([param_style] * len(chunk_ids))
+                sql_chunk = f"DELETE FROM {table_name} WHERE {field_name} IN ({sql_ids_params})"
+                sql_chunk_size = len(chunk_ids)
+
+            # short transaction per chunk, rolled back on failure
+            with self.transaction(cur, commit_interval=0) as transaction:
+                chunk_rows_affected = self.execute(cur=cur, sql=sql_chunk, params=chunk_ids, commit=False)
+                transaction.add(len(chunk_ids))
+            rows_affected += chunk_rows_affected
+
+            elapsed = round(time.perf_counter() - start, 3)
+            self.log.debug(f"delete_in: {table_name}: chunk {chunk_nbr + 1}/{nbr_chunks}: "
+                           f"{chunk_rows_affected} rows in {elapsed}s")
+        return rows_affected
+
+    def get_upsert_sql(self, field_names, primary_field):
+        # conflict clause for insert_many sql_upsert, updates all non primary fields of existing rows
+        # rows affected differ by engine, mysql counts 2 per updated row
+        update_field_names = [field_name for field_name in field_names if field_name != primary_field]
+        match self.config.db_engine:
+            case "sqlite3" | "postgres":
+                # sqlite 3.24+
+                sql_update_fields = ", ".join([f"{field_name} = excluded.{field_name}"
+                                               for field_name in update_field_names])
+                return f" ON CONFLICT ({primary_field}) DO UPDATE SET {sql_update_fields}"
+            case "mysql" | "mariadb":
+                sql_update_fields = ", ".join([f"{field_name} = VALUES({field_name})"
+                                               for field_name in update_field_names])
+                return f" ON DUPLICATE KEY UPDATE {sql_update_fields}"
+            case _:
+                raise NotImplementedError(f"get_upsert_sql: Unknown database engine: {self.config.db_engine}")
+
+    def _get_copy_text_value(self, value):
+        # postgres COPY text format; \N = null
+        if value is None:
+            return "\\N"
+        if isinstance(value, bool):
+            return "t" if value else "f"
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # bytea hex format, backslash escaped
+            return "\\\\x" + bytes(value).hex()
+        return str(value).translate(self.COPY_TEXT_ESCAPES)
+
+    def copy_from_rows(self, cur, table_name, field_names, rows, commit=True):
+        # postgres COPY ... FROM STDIN; rows serialized to an in memory buffer per batch
+        start = time.perf_counter()
+        nbr_rows = len(rows)
+        if nbr_rows == 0:
+            msg = "copy_from_rows without any values"
+            self.log.error(msg)
+            raise ValueError(msg)
+        if self.config.db_engine != "postgres":
+            raise NotImplementedError(f"copy_from_rows: not supported for database engine: {self.config.db_engine}")
+
+        sql_field_names = ", ".join(field_names)
+        sql = f"COPY {table_name} ({sql_field_names}) FROM STDIN"
+        try:
+            rows_affected = 0
+            if not self.config.dry_run:
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write("\t".join([self._get_copy_text_value(value) for value in self.get_row_values(row)]))
+                    buffer.write("\n")
+                buffer.seek(0)
+
+                cur.copy_expert(sql, buffer)
+                # COPY is all or nothing
+                rows_affected = nbr_rows
+                buffer.close()
+                if commit:
+                    cur.connection.commit()
+            else:
+                sql = f"Dryrun: {sql}"
+            self._log_execute(sql, nbr_rows, rows_affected, start)
+            return rows_affected
+        except Exception as e:
+            self.log.error("copy_from_rows: exception", e=e)
+            raise Exception(e)
+
+    def _get_load_data_value(self, value):
+        # mysql LOAD DATA default FIELDS ESCAPED BY '\\'; \N = null
+        if value is None:
+            return b"\\N"
+        if isinstance(value, bool):
+            return b"1" if value else b"0"
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+        else:
+            value = str(value).encode("utf8")
+        return (value.replace(b"\\", b"\\\\")
+                .replace(b"\t", b"\\t")
+                .replace(b"\n", b"\\n")
+                .replace(b"\r", b"\\r")
+                .replace(b"\0", b"\\0"))
+
+    def load_data_from_rows(self, cur, table_name, field_names, rows, commit=True):
+        # mysql|mariadb LOAD DATA LOCAL INFILE; rows serialized to a tsv temp file per batch
+        start = time.perf_counter()
+        nbr_rows = len(rows)
+        if nbr_rows == 0:
+            msg = "load_data_from_rows without any values"
+            self.log.error(msg)
+            raise ValueError(msg)
+        if self.config.db_engine not in ("mysql", "mariadb"):
+            raise NotImplementedError(f"load_data_from_rows: not supported for database engine: {self.config.db_engine}")
+        if not self.config.db_target_local_infile:
+            msg = "load_data_from_rows requires DB_TARGET_LOCAL_INFILE=1"
+            self.log.error(msg)
+            raise ValueError(msg)
+
+        sql_field_names = ", ".join(field_names)
+        param_style = self.get_param_style("position")
+        sql = (f"LOAD DATA LOCAL INFILE {param_style} INTO TABLE {table_name} CHARACTER SET utf8mb4 "
+               f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+               f"({sql_field_names})")
+        try:
+            rows_affected = 0
+            if not self.config.dry_run:
+                # closed before load, as the driver re-opens the file by name
+                fh = tempfile.NamedTemporaryFile(mode="wb", prefix="db-sync-pie-", suffix=".tsv", delete=False)
+                try:
+                    for row in rows:
+                        fh.write(b"\t".join([self._get_load_data_value(value) for value in self.get_row_values(row)]))
+                        fh.write(b"\n")
+                    fh.close()
+
+                    cur.execute(sql, (fh.name,))
+                    rows_affected = cur.rowcount
+                    if commit:
+                        cur.connection.commit()
+                finally:
+                    fh.close()
+                    os.remove(fh.name)
+            else:
+                sql = f"Dryrun: {sql}"
+            self._log_execute(sql, nbr_rows, rows_affected, start)
+            return rows_affected
+        except Exception as e:
+            self.log.error("load_data_from_rows: exception", e=e)
+            raise Exception(e)
+
     def execute_script(self, sql_file: LiteralString | str, cur: SSDictCursor):
         start = time.perf_counter()
 